@@ -6,6 +6,8 @@ import requests
 from flask import request
 from urllib.parse import urlparse
 from SearchAPI.asf_env import get_config
+from SearchAPI.asf_session import get_session
+from SearchAPI.asf_deadline import get_deadline
 
 
 def analytics_events(events=None):
@@ -27,19 +29,21 @@ def analytics_events(events=None):
         "cid":  f'{request.access_route[-1]}'
     }
 
+    # The pool threads can't see the request, work out the timeout here
+    timeout = get_deadline().timeout()
     events_with_params = [
-        combine_event_and_params(params, event) for event in events
+        (combine_event_and_params(params, event), timeout) for event in events
     ]
 
     start = time.time()
     try:
         if len(events) == 1:
-            post_analytics_event(events_with_params[0])
+            post_analytics_event(*events_with_params[0])
         else:
             num_processes = min([8, len(events)])
             p = multiprocessing.pool.ThreadPool(processes=num_processes)
 
-            p.map_async(post_analytics_event, events_with_params)
+            p.starmap_async(post_analytics_event, events_with_params)
             p.close()
             p.join()
 
@@ -59,12 +63,11 @@ def combine_event_and_params(params, event):
     return p
 
 
-def post_analytics_event(event):
+def post_analytics_event(event, timeout):
     logging.debug(f'POSTING EVENT {event}')
 
-    session = requests.Session()
     url = get_analytics_url()
-    session.post(url, data=event)
+    get_session().post(url, data=event, timeout=timeout)
 
 
 def get_analytics_url():
@@ -84,7 +87,6 @@ def analytics_pageview():
         "cid":  f'{request.access_route[-1]}'
         }
     try:
-        s = requests.Session()
         p = dict(params)
         p['t'] = 'pageview'
         p['uip'] = request.access_route[-1]
@@ -98,6 +100,6 @@ def analytics_pageview():
         else:
             p['dl'] = request.url # default to just blindly using the request url
         p['ua'] = request.headers.get('User-Agent')
-        s.post(url, data=p)
+        get_session().post(url, data=p, timeout=get_deadline().timeout())
     except requests.RequestException as e:
         logging.debug(f'Problem logging analytics: {e}')
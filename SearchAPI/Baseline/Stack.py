@@ -13,9 +13,9 @@ def get_stack(reference, req_fields=None, product_type=None):
     except ValueError as e:
         raise e
 
-    req_fields.extend([
+    req_fields = req_fields + [
         'granuleName',
-        'startTime'])
+        'startTime']
     if get_platform(reference) in precalc_datasets:
         req_fields.append('insarBaseline')
     elif get_platform(reference) in ['S1']:
@@ -0,0 +1,124 @@
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache bounded by the total size of what it holds, with
+    a time to live on each entry. Sizes are whatever the caller says they
+    are, we just keep the running total under max_bytes.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry[1] < time.time():
+                self.remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes, ttl):
+        if nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+
+            self.entries[key] = (value, time.time() + ttl, nbytes)
+            self.size += nbytes
+
+            while self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self.remove(oldest)
+                self.evictions += 1
+
+    def remove(self, key):
+        _, _, nbytes = self.entries.pop(key)
+        self.size -= nbytes
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups > 0 else None
+            }
+
+
+class CachedPage:
+    """
+    A page of parsed CMR results, plus what's needed to carry on paging
+    from it without asking CMR again
+    """
+    def __init__(self, records, hits, search_after):
+        self.records = records
+        self.hits = hits
+        self.search_after = search_after
+
+
+class CachedCount:
+    """
+    A CMR hit count, and when CMR last confirmed it
+    """
+    def __init__(self, hits, checked_at):
+        self.hits = hits
+        self.checked_at = checked_at
+
+
+# Process-wide caches, each sized from whichever config gets here first.
+# TTLs are per maturity, so they're set on each put.
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def shared_cache(name, size_mb):
+    with _caches_lock:
+        if name not in _caches:
+            max_bytes = size_mb * 1024 * 1024
+            logging.debug(f'New CMR {name} cache, {max_bytes} bytes')
+            _caches[name] = TTLCache(max_bytes)
+
+    return _caches[name]
+
+
+def page_cache(cfg):
+    return shared_cache('page', cfg['cmr_page_cache_mb'])
+
+
+def count_cache(cfg):
+    return shared_cache('count', cfg['cmr_count_cache_mb'])
+
+
+def lookup_cache(cfg):
+    return shared_cache('lookup', cfg['cmr_lookup_cache_mb'])
+
+
+def cache_stats():
+    with _caches_lock:
+        caches = dict(_caches)
+
+    return {name: cache.stats() for name, cache in caches.items()}
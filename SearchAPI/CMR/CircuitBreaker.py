@@ -0,0 +1,220 @@
+from collections import deque
+import logging
+import random
+import threading
+import time
+
+from SearchAPI.CMR.Exceptions import CMRUnavailableError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Watches the outcome of recent CMR calls. Once too many of them fail
+    (errors on CMR's side or timeouts, not just slow ones: a big page can
+    take a while), the circuit opens and calls fail immediately instead of
+    piling onto a struggling CMR. After open_seconds a single trial call is
+    let through: if it works the circuit closes again, if not it stays open.
+    A trial that never reports back is given up on after trial_seconds.
+    """
+    def __init__(self, name, failure_rate, open_seconds, trial_seconds,
+                 window_seconds=60, min_calls=10):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.trial_seconds = trial_seconds
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+
+        self.lock = threading.Lock()
+        self.calls = deque() # (timestamp, failed)
+        self.state = CLOSED
+        self.opened_at = None
+        self.trial = None # (token, started_at) of the half-open trial call
+
+    def allow(self):
+        """
+        Whether a call can go ahead, and if it's the half-open trial, a
+        token for it
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return True, None
+
+            now = time.time()
+            if self.state == OPEN:
+                if now - self.opened_at < self.open_seconds:
+                    return False, None
+                logging.warning(f'CMR circuit {self.name} half-open, sending a trial request')
+                self.state = HALF_OPEN
+
+            # Half-open: one trial at a time
+            self.expire_trial(now)
+            if self.trial is not None:
+                return False, None
+
+            token = object()
+            self.trial = (token, now)
+            return True, token
+
+    def is_open(self):
+        """
+        Whether calls would be turned away right now, without using up the
+        half-open trial
+        """
+        with self.lock:
+            now = time.time()
+            if self.state == HALF_OPEN:
+                self.expire_trial(now)
+                return self.trial is not None
+
+            return (
+                self.state == OPEN and
+                now - self.opened_at < self.open_seconds
+            )
+
+    def expire_trial(self, now):
+        # Lock held. However the trial got lost, it mustn't hold the circuit
+        # half-open (turning everything away) for good
+        if self.trial is not None and now - self.trial[1] > self.trial_seconds:
+            logging.error(f'CMR circuit {self.name} trial never finished, allowing another')
+            self.trial = None
+
+    def check(self):
+        """
+        Raises CMRUnavailableError if the call can't go ahead. Returns the
+        trial token if it's the half-open trial: it has to be release()d once
+        the call is over, however it ended.
+        """
+        allowed, trial = self.allow()
+        if not allowed:
+            raise CMRUnavailableError(
+                'CMR is not responding reliably right now, please try again later'
+            )
+
+        return trial
+
+    def record(self, failed, trial=None):
+        now = time.time()
+
+        with self.lock:
+            if self.is_trial(trial):
+                self.trial = None
+                if failed:
+                    self.trip(now)
+                else:
+                    logging.warning(f'CMR circuit {self.name} closed')
+                    self.state = CLOSED
+                    self.calls.clear()
+                return
+
+            self.calls.append((now, failed))
+            while self.calls and self.calls[0][0] < now - self.window_seconds:
+                self.calls.popleft()
+
+            if self.state == CLOSED and self.should_trip():
+                self.trip(now)
+
+    def release(self, trial):
+        """
+        The trial call is over without a verdict on CMR (or it already gave
+        one), the next call can be the trial
+        """
+        with self.lock:
+            if self.is_trial(trial):
+                self.trial = None
+
+    def is_trial(self, trial):
+        return trial is not None and self.trial is not None and self.trial[0] is trial
+
+    def should_trip(self):
+        if len(self.calls) < self.min_calls:
+            return False
+
+        failures = sum(1 for _, failed in self.calls if failed)
+
+        return failures / len(self.calls) >= self.failure_rate
+
+    def trip(self, now):
+        logging.error(f'CMR circuit {self.name} open for {self.open_seconds} seconds')
+        self.state = OPEN
+        self.opened_at = now
+
+
+class RetryBudget:
+    """
+    Caps retries across the whole process to a fraction of recent requests
+    (plus a small trickle so quiet periods can still retry), so a CMR
+    brownout doesn't turn every thread into a retry loop
+    """
+    def __init__(self, ratio, per_second=1, capacity=20):
+        self.ratio = ratio
+        self.per_second = per_second
+        self.capacity = capacity
+
+        self.lock = threading.Lock()
+        self.tokens = capacity
+        self.updated = time.time()
+
+    def refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    def deposit(self):
+        with self.lock:
+            self.refill()
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            self.refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def backoff(attempt, base=0.5, cap=8):
+    """
+    Full jitter exponential backoff: somewhere between nothing and
+    base * 2^attempt seconds, so retrying threads don't move in lockstep
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+_breakers = {}
+_retry_budget = None
+_lock = threading.Lock()
+
+
+def cmr_breaker(cfg):
+    """
+    One breaker per CMR host, shared by every thread in the process
+    """
+    host = cfg['cmr_base']
+
+    with _lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(
+                host,
+                failure_rate=cfg['cmr_breaker_failure_rate'],
+                open_seconds=cfg['cmr_breaker_open_seconds'],
+                # As long as a CMR request can possibly take
+                trial_seconds=cfg['http_connect_timeout'] + cfg['cmr_request_timeout']
+            )
+
+    return _breakers[host]
+
+
+def retry_budget(cfg):
+    global _retry_budget
+
+    with _lock:
+        if _retry_budget is None:
+            _retry_budget = RetryBudget(cfg['cmr_retry_budget'])
+
+    return _retry_budget
@@ -0,0 +1,284 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+import logging
+import multiprocessing
+import threading
+
+
+_global_semaphore = None
+_global_semaphore_lock = threading.Lock()
+
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+_call_executor = None
+_call_executor_lock = threading.Lock()
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def global_semaphore(size):
+    """
+    Process-wide cap on CMR requests in flight. It's shared by every query
+    running in this worker, so it gets built once from whichever config
+    gets here first.
+    """
+    global _global_semaphore
+
+    with _global_semaphore_lock:
+        if _global_semaphore is None:
+            logging.debug(f'Limiting CMR to {size} concurrent requests per process')
+            _global_semaphore = threading.BoundedSemaphore(size)
+
+    return _global_semaphore
+
+
+def shared_executor(size):
+    """
+    Process-wide thread pool for CMR calls, counts and result pages alike,
+    built once like the global semaphore. Sized to cmr_global_concurrency,
+    so the threads making CMR calls don't grow with the number of queries
+    or subqueries.
+    """
+    global _shared_executor
+
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(
+                max_workers=size,
+                thread_name_prefix='cmr'
+            )
+
+    return _shared_executor
+
+
+def call_executor(size):
+    """
+    Process-wide thread pool the CMR requests themselves run on, so callers
+    can stop waiting on one without stopping it (see SingleFlight). Kept
+    apart from the shared executor, whose tasks wait on these.
+    """
+    global _call_executor
+
+    with _call_executor_lock:
+        if _call_executor is None:
+            _call_executor = ThreadPoolExecutor(
+                max_workers=size,
+                thread_name_prefix='cmr-call'
+            )
+
+    return _call_executor
+
+
+def parse_pool(size):
+    """
+    Process-wide pool of worker processes for parsing CMR pages, built once
+    like the shared executor. Workers are spawned rather than forked, this
+    process has threads (and held locks) a fork would copy.
+    """
+    global _parse_pool
+
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            logging.debug(f'Starting {size} CMR parsing processes')
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=size,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+
+    return _parse_pool
+
+
+def discard_parse_pool(pool):
+    """
+    A worker died and took the pool down with it, whoever asks next gets a
+    new one
+    """
+    global _parse_pool
+
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class CMRLimiter:
+    """
+    Caps the number of CMR requests in flight, both for a single query and
+    across every query running in this process. Only held for the duration
+    of a request, never while a result sits waiting to be consumed.
+    """
+    def __init__(self, query_limit, global_limit):
+        self.query_semaphore = threading.BoundedSemaphore(query_limit)
+        self.global_semaphore = global_semaphore(global_limit)
+
+    def __enter__(self):
+        # Always acquire in the same order so queries can't deadlock each other
+        self.query_semaphore.acquire()
+        self.global_semaphore.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def try_acquire(self):
+        """
+        Take a slot only if there's one free right now, for extra requests
+        (hedges) that aren't worth waiting for. release() it afterwards.
+        """
+        if not self.query_semaphore.acquire(blocking=False):
+            return False
+
+        if not self.global_semaphore.acquire(blocking=False):
+            self.query_semaphore.release()
+            return False
+
+        return True
+
+    def release(self):
+        self.global_semaphore.release()
+        self.query_semaphore.release()
+
+
+class TaskGate:
+    """
+    Hands tasks to a shared executor, no more than limit of them at once.
+    The rest wait their turn here instead of in the executor, where they'd
+    tie up threads every other query needs.
+    """
+    def __init__(self, executor, limit):
+        self.executor = executor
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.running = 0
+        self.waiting = deque()
+
+    def submit(self, fn, *args):
+        future = Future()
+
+        with self.lock:
+            if self.running >= self.limit:
+                self.waiting.append((future, fn, args))
+                return future
+            self.running += 1
+
+        self.start(future, fn, args)
+        return future
+
+    def start(self, future, fn, args):
+        def run():
+            # Cancelled while it was waiting
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.executor.submit(run).add_done_callback(self.finished)
+
+    def finished(self, _):
+        with self.lock:
+            if not self.waiting:
+                self.running -= 1
+                return
+            future, fn, args = self.waiting.popleft()
+
+        self.start(future, fn, args)
+
+
+class PrefetchStream:
+    """
+    Steps a generator forward with submit (an executor's or a TaskGate's),
+    staying up to depth items ahead of the consumer. There's no thread
+    sitting on the generator between steps, each one is its own task, and
+    the next is only submitted once there's room for what it produces.
+    """
+    _done = object()
+
+    def __init__(self, source, submit, depth):
+        self.source = source
+        self.submit = submit
+        self.depth = depth
+        self.items = deque()
+        self.step = None
+        self.finished = False
+        self.closed = False
+        self.error = None
+        self.ready = threading.Condition()
+
+        with self.ready:
+            self.schedule()
+
+    def schedule(self):
+        # Only ever one step in flight, generators can't be run concurrently
+        if (
+            self.step is None and
+            not self.finished and
+            not self.closed and
+            len(self.items) < self.depth
+        ):
+            self.step = self.submit(self.advance)
+
+    def advance(self):
+        try:
+            item = next(self.source)
+        except StopIteration:
+            item = self._done
+        except Exception as e: # Hand it off to the consuming thread
+            logging.error(f'Prefetch stream failed: {e}')
+            self.error = e
+            item = self._done
+
+        with self.ready:
+            self.step = None
+            if item is self._done:
+                self.finished = True
+            else:
+                self.items.append(item)
+            self.ready.notify_all()
+            self.schedule()
+            closed = self.closed
+
+        # Closed while this step was running, it's ours to clean up
+        if closed:
+            self.source.close()
+
+    def wait_ready(self):
+        """
+        Block until there's an item to hand out, or there won't be any
+        """
+        with self.ready:
+            while not self.items and not self.finished:
+                self.ready.wait()
+
+    def close(self):
+        with self.ready:
+            if self.closed:
+                return
+            self.closed = True
+
+            # A running step closes the source itself when it's done
+            if self.step is not None and not self.step.cancel():
+                return
+            self.step = None
+
+        self.source.close()
+
+    def __iter__(self):
+        while True:
+            with self.ready:
+                while not self.items and not self.finished:
+                    self.ready.wait()
+
+                if not self.items:
+                    if self.error is not None:
+                        raise self.error
+                    return
+
+                item = self.items.popleft()
+                self.schedule()
+
+            yield item
@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+
+from SearchAPI.CMR.Exceptions import CursorUnavailableError
+
+# Cursors handed out by one worker or container have to be accepted by all the
+# others, so every deployment shares one signing key. Without it, paged
+# searches fail rather than hand out cursors that only work against the same
+# process. Everything else still works.
+_secret = os.environ.get('SEARCH_CURSOR_SECRET', '').encode()
+
+if not _secret:
+    logging.error('SEARCH_CURSOR_SECRET not set! Paged searches (pagesize=) will fail until it is.')
+
+
+def require_secret():
+    if not _secret:
+        raise CursorUnavailableError('Paged searches are not available: this API has no cursor signing key configured')
+
+
+# Search params resolved against the current time (a missing end, "1 week
+# ago"). They're carried in the cursor from the first page, so every page
+# searches the same range.
+resolved_params = ['temporal', 'processingdate']
+
+
+def query_fingerprint(params):
+    """
+    Ties a cursor to the search it came from, so it can't be replayed
+    against a different one. Taken from the params as the client sent them,
+    which stay the same from page to page when the resolved ones don't.
+    """
+    normalized = {k.lower(): v for k, v in params.items()}
+    encoded = json.dumps(normalized, sort_keys=True, default=str)
+
+    return hashlib.sha256(encoded.encode()).hexdigest()[:16]
+
+
+def sign(payload):
+    require_secret()
+    return hmac.new(_secret, payload, hashlib.sha256).digest()
+
+
+def encode_cursor(params, cmr_params, position):
+    """
+    Opaque token for where the next page starts: which subquery, and the
+    CMR-Search-After value to pick it up from
+    """
+    index, search_after = position
+    payload = json.dumps({
+        'q': query_fingerprint(params),
+        's': index,
+        'a': search_after,
+        'r': {k: cmr_params[k] for k in resolved_params if k in cmr_params}
+    }, separators=(',', ':')).encode()
+
+    return '.'.join(
+        base64.urlsafe_b64encode(part).decode().rstrip('=')
+        for part in (payload, sign(payload))
+    )
+
+
+def decode_cursor(token, params):
+    """
+    Where the next page starts, and the resolved params to search it with
+    """
+    try:
+        payload, signature = (
+            base64.urlsafe_b64decode(part + '=' * (-len(part) % 4))
+            for part in token.split('.')
+        )
+        position = json.loads(payload)
+    except ValueError as exc:
+        raise ValueError(f'Invalid cursor: {token}') from exc
+
+    if not hmac.compare_digest(signature, sign(payload)):
+        raise ValueError(f'Invalid cursor: {token}')
+
+    if position['q'] != query_fingerprint(params):
+        raise ValueError('cursor does not belong to this search, search parameters must not change between pages')
+
+    return (position['s'], position['a']), position.get('r', {})
@@ -4,3 +4,10 @@ class CMRError(Exception):
 class APIValidationError(Exception):
     pass
 
+
+class CMRUnavailableError(CMRError):
+    pass
+
+
+class CursorUnavailableError(Exception):
+    pass
@@ -0,0 +1,59 @@
+import numpy as np
+
+
+def shape_from_gpolygon(gpoly):
+    """
+    The longest ring of an echo10 GPolygon, closed, as an (n, 2) array of
+    lon, lat, along with its WKT. The WKT keeps CMR's own formatting of
+    each number.
+    """
+    rings = []
+    for g in gpoly:
+        lons = [e.text for e in g.iter('PointLongitude')]
+        lats = [e.text for e in g.iter('PointLatitude')]
+
+        if lons[0] != lons[-1] or lats[0] != lats[-1]:
+            # Close the shape if needed
+            lons.append(lons[0])
+            lats.append(lats[0])
+
+        rings.append((lons, lats))
+
+    # First of the longest, if there's a tie
+    lons, lats = max(rings, key=lambda ring: len(ring[0]))
+
+    shape = np.column_stack([np.array(lons, dtype=float), np.array(lats, dtype=float)])
+    wkt_shape = 'POLYGON(({0}))'.format(','.join(map('{0} {1}'.format, lons, lats)))
+
+    return shape, wkt_shape
+
+
+def unwrap_shape(shape):
+    """
+    Footprints that cross the antimeridian, moved so they don't wrap: every
+    longitude west of it gets 360 added
+    """
+    lons = shape[:, 0]
+
+    if lons.max() - lons.min() <= 180:
+        return shape
+
+    unwrapped = shape.copy()
+    unwrapped[:, 0] = np.where(lons > 0, lons, lons + 360)
+
+    return unwrapped
+
+
+def shape_to_wkt(shape, decimals=6):
+    point = f'%.{decimals}f %.{decimals}f'
+
+    return 'POLYGON (({0}))'.format(
+        ', '.join([point] * len(shape)) % tuple(shape.ravel().tolist())
+    )
+
+
+def shape_points(shape):
+    """
+    [lon, lat] pairs, as plain floats, for GeoJSON and KML
+    """
+    return shape.tolist()
@@ -1,12 +1,12 @@
-import requests
 import logging
 import json
 from SearchAPI.asf_env import get_config
+from SearchAPI.asf_session import get_session
 
 def get_cmr_health():
     cfg = get_config()
     try:
-        r = requests.get(cfg['cmr_base'] + cfg['cmr_health'], timeout=10)
+        r = get_session().get(cfg['cmr_base'] + cfg['cmr_health'], timeout=10)
         d = {'host': cfg['cmr_base'], 'health': json.loads(r.text)}
     except Exception as e:
         logging.debug(e)
@@ -0,0 +1,153 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import threading
+from time import perf_counter
+
+from SearchAPI.CMR.CircuitBreaker import RetryBudget
+
+
+class LatencyTracker:
+    """
+    Recent response times for one CMR endpoint, so we know what "slower
+    than usual" means for it
+    """
+    def __init__(self, size=200, min_samples=20):
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, duration):
+        with self.lock:
+            self.samples.append(duration)
+
+    def percentile(self, p):
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            samples = sorted(self.samples)
+
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+_trackers = {}
+_hedge_budget = None
+_hedge_executor = None
+_lock = threading.Lock()
+
+
+def latency_tracker(url, kind):
+    with _lock:
+        if (url, kind) not in _trackers:
+            _trackers[(url, kind)] = LatencyTracker()
+
+    return _trackers[(url, kind)]
+
+
+def request_kind(params):
+    """
+    Which requests' latencies are comparable: counts are on their own, pages
+    are grouped by size, to within a factor of two
+    """
+    page_size = next((int(v) for k, v in params if k == 'page_size'), 0)
+
+    return 'count' if page_size == 0 else f'page-{page_size.bit_length()}'
+
+
+def hedge_budget(cfg):
+    """
+    Hedges are limited to a small fraction of requests (cmr_hedge_budget),
+    process-wide, so hedging can't double the load on an already slow CMR
+    """
+    global _hedge_budget
+
+    with _lock:
+        if _hedge_budget is None:
+            _hedge_budget = RetryBudget(cfg['cmr_hedge_budget'], per_second=0, capacity=5)
+
+    return _hedge_budget
+
+
+def hedge_executor(size):
+    # Separate from the other executors: hedged calls come from their
+    # threads, and must never wait on a pool their caller is holding.
+    # Room for every request the limiter allows and a hedge for each.
+    global _hedge_executor
+
+    with _lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=size * 2,
+                thread_name_prefix='cmr-hedge'
+            )
+
+    return _hedge_executor
+
+
+def hedged(call, url, cfg, kind, limiter=None):
+    """
+    Make a request, and if it's taking longer than cmr_hedge_percentile of
+    recent requests of the same kind to the same endpoint, fire off a
+    duplicate and take whichever answers first. The duplicate needs a free
+    slot in the limiter, it's never worth waiting for one. The loser is
+    left to finish on its own.
+    """
+    tracker = latency_tracker(url, kind)
+    budget = hedge_budget(cfg)
+    budget.deposit()
+
+    def timed(sent=None):
+        start = perf_counter()
+        if sent is not None:
+            sent.set()
+        result = call()
+        tracker.record(perf_counter() - start)
+        return result
+
+    delay = tracker.percentile(cfg['cmr_hedge_percentile'])
+
+    # Not enough history yet to know what slow looks like
+    if delay is None:
+        return timed()
+
+    executor = hedge_executor(cfg['cmr_global_concurrency'])
+
+    sent = threading.Event()
+    first = executor.submit(timed, sent)
+
+    # The delay runs from when the request goes out, time spent waiting for
+    # a thread doesn't make it slow
+    sent.wait()
+    done, _ = wait([first], timeout=delay)
+
+    if done:
+        return first.result()
+
+    if limiter is not None and not limiter.try_acquire():
+        logging.debug('No room under the limiter to hedge, waiting it out')
+        return first.result()
+
+    if not budget.withdraw():
+        if limiter is not None:
+            limiter.release()
+        return first.result()
+
+    def duplicate():
+        try:
+            return timed()
+        finally:
+            if limiter is not None:
+                limiter.release()
+
+    logging.warning(f'CMR request slower than {delay:.2f}s, hedging: {url}')
+    second = executor.submit(duplicate)
+    pending = {first, second}
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        # If one of them fails, the other still gets its chance
+        for f in sorted(done, key=lambda f: f.exception() is not None):
+            if f.exception() is None or not pending:
+                if f is second:
+                    logging.warning('Hedged CMR request won')
+                return f.result()
@@ -0,0 +1,109 @@
+import logging
+
+from SearchAPI.CMR.Cache import lookup_cache
+
+# List lookups, and the result fields that say which requested name a
+# result belongs to. CMR matches readable_granule_name against both.
+lookup_fields = {
+    'granule_list': ['granuleName', 'product_file_id'],
+    'product_list': ['product_file_id'],
+}
+
+# CMR's granule_ur, unique to each record whichever name found it
+canonical_field = 'product_file_id'
+
+
+def lookup_param(params):
+    """
+    The list being looked up, if this is a granule_list/product_list search
+    """
+    for k in lookup_fields:
+        if k in params:
+            return k
+
+    return None
+
+
+class RecentLookups:
+    """
+    Results of recent granule_list/product_list lookups, by name, so a name
+    looked up a minute ago doesn't cost another trip to CMR. Entries are
+    only written once a chunk has been fetched in full, and a name CMR had
+    nothing for is remembered as such.
+
+    A record can be found by more than one name (its granule name and its
+    product name), so each record is stored once under its canonical ID,
+    and a name only remembers the IDs it found.
+    """
+    def __init__(self, cfg, param, scope):
+        self.cfg = cfg
+        self.param = param
+        self.fields = lookup_fields[param]
+        # Whatever else changes what a name finds: CMR, provider, token,
+        # fields, the search's other filters
+        self.scope = scope
+
+    def enabled(self):
+        return self.cfg['cmr_lookup_cache_ttl'] > 0
+
+    def key(self, name):
+        return (self.param, name, self.scope)
+
+    def record_key(self, record_id):
+        return (canonical_field, record_id, self.scope)
+
+    def split(self, names):
+        """
+        Cached results for the names we have, each record once however many
+        names found it, and the names still to look up
+        """
+        if not self.enabled():
+            return [], names
+
+        cache = lookup_cache(self.cfg)
+        found, remaining = {}, []
+
+        for name in names:
+            ids = cache.get(self.key(name))
+            records = None if ids is None else [cache.get(self.record_key(i)) for i in ids]
+            if records is None or any(r is None for r in records):
+                remaining.append(name)
+            else:
+                found.update(zip(ids, records))
+
+        # CMR sends back anything a remaining name matches, leave those out
+        # here so they aren't in the results twice
+        pending = set(remaining)
+        results = [
+            # Translators modify results in place, hand out copies
+            r.copy() for r in found.values()
+            if pending.isdisjoint(r.get(f) for f in self.fields)
+        ]
+
+        logging.debug(f'{len(names) - len(remaining)} of {len(names)} names found in lookup cache, {len(results)} results')
+
+        return results, remaining
+
+    def remember(self, names, records):
+        if not self.enabled():
+            return
+
+        if any(r.get(canonical_field) is None for r in records):
+            logging.debug('Lookup results without an ID, not remembering them')
+            return
+
+        by_name = {name: [] for name in names}
+        for r in records:
+            for name in {r.get(f) for f in self.fields}:
+                if name in by_name:
+                    by_name[name].append(r[canonical_field])
+
+        cache = lookup_cache(self.cfg)
+        ttl = self.cfg['cmr_lookup_cache_ttl']
+
+        for r in records:
+            record_id = r[canonical_field]
+            cache.put(self.record_key(record_id), r, nbytes=len(record_id) + len(repr(r)), ttl=ttl)
+
+        for name, ids in by_name.items():
+            cache.put(self.key(name), ids, nbytes=len(name) + sum(len(i) for i in ids), ttl=ttl)
@@ -1 +1,2 @@
 from .output_translators import output_translators
+from .coalesce import coalesce_chunks
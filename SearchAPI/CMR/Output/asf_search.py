@@ -1,6 +1,6 @@
 import logging
-import json
-from .json import JSONStreamArray
+from .json import JSONStreamArray, results_marker
+from SearchAPI.CMR.Footprint import shape_points
 
 def req_fields_asf_search():
     fields = [
@@ -33,15 +33,17 @@ def req_fields_asf_search():
         'stopTime',
         'downloadUrl',
         'canInsar',
+        'stateVectors', # goes out as the baseline
     ]
     return fields
 
-def cmr_to_asf_search(rgen, includeBaseline=False, addendum=None):
+def cmr_to_asf_search(rgen, includeBaseline=False, addendum=None, truncated=None):
     logging.debug('translating: asf_search')
 
-    streamer = ASFSearchStreamArray(rgen, includeBaseline)
+    streamer = ASFSearchStreamArray(rgen, includeBaseline, truncated)
+    collection = {'type': 'FeatureCollection','features':results_marker}
 
-    for p in json.JSONEncoder(indent=2, sort_keys=True).iterencode({'type': 'FeatureCollection','features':streamer}):
+    for p in streamer.stream(collection, indent=2, truncated_document={**collection, 'truncated': True}):
         yield p
 
 
@@ -49,7 +51,7 @@ class ASFSearchStreamArray(JSONStreamArray):
 
     def getItem(self, p):
         for i in p.keys():
-            if p[i] == 'NA' or p[i] == '':
+            if isinstance(p[i], str) and p[i] in ['NA', '']:
                 p[i] = None
         try:
             if float(p['offNadirAngle']) < 0:
@@ -60,12 +62,12 @@ class ASFSearchStreamArray(JSONStreamArray):
             pass
 
         result = {
-            'type': 'Feature',
+            'baseline': p.pop('baseline', None),
             'geometry': {
-                'type': 'Polygon',
                 'coordinates': [
-                    [[float(c['lon']), float(c['lat'])] for c in p['shape']]
-                ]
+                    shape_points(p['shape'])
+                ],
+                'type': 'Polygon'
             },
             'properties': {
                 'beamModeType': p['beamModeType'],
@@ -78,13 +80,14 @@ class ASFSearchStreamArray(JSONStreamArray):
                 'fileName': p['fileName'],
                 'flightDirection': p['flightDirection'],
                 'frameNumber': p['frameNumber'],
-                'groupID': p['groupID'],
                 'granuleType': p['granuleType'],
+                'groupID': p['groupID'],
                 'insarStackId': p['insarGrouping'],
                 'md5sum': p['md5sum'],
                 'offNadirAngle': p['offNadirAngle'],
                 'orbit': p['absoluteOrbit'][0],
                 'pathNumber': p['relativeOrbit'],
+                'perpendicularBaseline': p.pop('perpendicularBaseline', None),
                 'platform': p['platform'],
                 'pointingAngle': p['pointingAngle'],
                 'polarization': p['polarization'],
@@ -94,11 +97,10 @@ class ASFSearchStreamArray(JSONStreamArray):
                 'sensor': p['sensor'],
                 'startTime': p['startTime'],
                 'stopTime': p['stopTime'],
-                'url': p['downloadUrl'],
                 'temporalBaseline': p.pop('temporalBaseline', None),
-                'perpendicularBaseline': p.pop('perpendicularBaseline', None)
+                'url': p['downloadUrl']
             },
-            'baseline': p.pop('baseline', None),
+            'type': 'Feature'
         }
 
         return result
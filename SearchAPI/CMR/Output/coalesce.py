@@ -0,0 +1,41 @@
+import time
+
+
+def coalesce_chunks(chunks, chunk_bytes, flush_seconds, results):
+    """
+    Joins the many small strings the translators yield into chunks of about
+    chunk_bytes, rather than a write to the client for every token. Until
+    the query (results() says how many it has yielded) gets past its first
+    result, chunks go out as soon as they're ready, so the header and the
+    first result aren't held back. After that, whatever has built up also
+    goes out once flush_seconds have gone by since the last write, so a
+    trickle of results isn't held back until a full chunk builds up. A
+    chunk_bytes of 0 passes chunks through as they come.
+
+    This all runs in the generator itself, in the request's own thread and
+    context. A chunk only goes out when the next one arrives, so a slow CMR
+    page can hold back at most one partial chunk until it's done.
+    """
+    if chunk_bytes <= 0:
+        yield from chunks
+        return
+
+    pending = []
+    size = 0
+    last_write = time.monotonic()
+
+    try:
+        for chunk in chunks:
+            pending.append(chunk)
+            size += len(chunk)
+
+            if results() <= 1 or size >= chunk_bytes or time.monotonic() - last_write >= flush_seconds:
+                yield ''.join(pending)
+                pending = []
+                size = 0
+                last_write = time.monotonic()
+
+        if pending:
+            yield ''.join(pending)
+    finally:
+        chunks.close()
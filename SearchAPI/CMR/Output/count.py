@@ -3,6 +3,6 @@ import logging
 def req_fields_count():
     return []
 
-def count(r, includeBaseline=False, addendum=None):
+def count(r, includeBaseline=False, addendum=None, truncated=None):
     logging.debug('translating: count')
     return str(r)
@@ -38,7 +38,7 @@ def req_fields_csv():
     ]
     return fields
 
-def cmr_to_csv(rgen, includeBaseline=False, addendum=None):
+def cmr_to_csv(rgen, includeBaseline=False, addendum=None, truncated=None):
     logging.debug('translating: csv')
 
     templateEnv = Environment(
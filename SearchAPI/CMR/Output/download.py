@@ -1,6 +1,7 @@
 import logging
-import requests
 from SearchAPI.asf_env import get_config
+from SearchAPI.asf_session import get_session
+from SearchAPI.asf_deadline import get_deadline
 
 def req_fields_download():
     fields = [
@@ -8,9 +9,13 @@ def req_fields_download():
     ]
     return fields
 
-def cmr_to_download(rgen, includeBaseline=False, addendum=None):
+def cmr_to_download(rgen, includeBaseline=False, addendum=None, truncated=None):
     logging.debug('translating: bulk download script')
     plist = [p['downloadUrl'] for p in rgen()]
-    bd_res = requests.post(get_config()['bulk_download_api'], data={'products': ','.join(plist)})
+    bd_res = get_session().post(
+        get_config()['bulk_download_api'],
+        data={'products': ','.join(plist)},
+        timeout=get_deadline().timeout()
+    )
 
     yield bd_res.text
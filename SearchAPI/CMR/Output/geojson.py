@@ -1,6 +1,6 @@
 import logging
-import json
-from .json import JSONStreamArray
+from .json import JSONStreamArray, results_marker
+from SearchAPI.CMR.Footprint import shape_points
 
 def req_fields_geojson():
     fields = [
@@ -35,12 +35,13 @@ def req_fields_geojson():
     ]
     return fields
 
-def cmr_to_geojson(rgen, includeBaseline=False, addendum=None):
+def cmr_to_geojson(rgen, includeBaseline=False, addendum=None, truncated=None):
     logging.debug('translating: geojson')
 
-    streamer = GeoJSONStreamArray(rgen, includeBaseline)
+    streamer = GeoJSONStreamArray(rgen, includeBaseline, truncated)
+    collection = {'type': 'FeatureCollection','features':results_marker}
 
-    for p in json.JSONEncoder(indent=2, sort_keys=True).iterencode({'type': 'FeatureCollection','features':streamer}):
+    for p in streamer.stream(collection, indent=2, truncated_document={**collection, 'truncated': True}):
         yield p
 
 
@@ -48,7 +49,7 @@ class GeoJSONStreamArray(JSONStreamArray):
 
     def getItem(self, p):
         for i in p.keys():
-            if p[i] == 'NA' or p[i] == '':
+            if isinstance(p[i], str) and p[i] in ['NA', '']:
                 p[i] = None
         try:
             if float(p['offNadirAngle']) < 0:
@@ -59,12 +60,11 @@ class GeoJSONStreamArray(JSONStreamArray):
             pass
 
         result = {
-            'type': 'Feature',
             'geometry': {
-                'type': 'Polygon',
                 'coordinates': [
-                    [[float(c['lon']), float(c['lat'])] for c in p['shape']]
-                ]
+                    shape_points(p['shape'])
+                ],
+                'type': 'Polygon'
             },
             'properties': {
                 'beamModeType': p['beamModeType'],
@@ -77,8 +77,8 @@ class GeoJSONStreamArray(JSONStreamArray):
                 'fileName': p['fileName'],
                 'flightDirection': p['flightDirection'],
                 'frameNumber': p['frameNumber'],
-                'groupID': p['groupID'],
                 'granuleType': p['granuleType'],
+                'groupID': p['groupID'],
                 'insarStackId': p['insarGrouping'],
                 'md5sum': p['md5sum'],
                 'offNadirAngle': p['offNadirAngle'],
@@ -94,10 +94,12 @@ class GeoJSONStreamArray(JSONStreamArray):
                 'startTime': p['startTime'],
                 'stopTime': p['stopTime'],
                 'url': p['downloadUrl'],
-            }
+            },
+            'type': 'Feature'
         }
         if self.includeBaseline:
             result['properties']['temporalBaseline'] = p['temporalBaseline']
             result['properties']['perpendicularBaseline'] = p['perpendicularBaseline']
+            result['properties'] = self.in_order(result['properties'])
 
         return result
@@ -1,5 +1,6 @@
 import logging
 import json
+from .json_backend import dumps_list_items, batch_size
 
 def req_fields_json():
     fields = [
@@ -74,36 +75,98 @@ def req_fields_json():
     ]
     return fields
 
-def cmr_to_json(rgen, includeBaseline=False, addendum=None):
+def cmr_to_json(rgen, includeBaseline=False, addendum=None, truncated=None):
     logging.debug('translating: json')
 
-    streamer = JSONStreamArray(rgen, includeBaseline)
+    streamer = JSONStreamArray(rgen, includeBaseline, truncated)
 
-    for p in json.JSONEncoder(indent=2, sort_keys=True).iterencode([streamer]):
+    # No envelope to put the flag in, it goes after the results list instead
+    for p in streamer.stream([results_marker], indent=2, truncated_document=[results_marker, {'truncated': True}]):
         yield p
 
-# Some trickery is required to make JSONEncoder().iterencode take any ol' generator,
-# this approach works without slurping the list into memory
-class JSONStreamArray(list):
-    def __init__(self, gen, includeBaseline):
+# Stands in for the results list while the JSON around it is encoded
+results_marker = '\0results\0'
+
+class JSONStreamArray:
+    """
+    Results as a list somewhere in a JSON document, written in a single pass
+    over the results: everything up to the list, each result as it comes,
+    then the rest of the document. Looks the same as if the encoder had been
+    given the whole list.
+
+    If the results were cut short (truncated() says so once they run out),
+    the rest of the document comes from truncated_document instead, so the
+    flag saying so can go after the list.
+    """
+    def __init__(self, gen, includeBaseline, truncated=None):
         self.gen = gen
         self.includeBaseline = includeBaseline
+        self.truncated = truncated
+        self.key_orders = {}
 
-        # need to make sure we actually have results so we can intelligently set __len__, otherwise
-        # iterencode behaves strangely and will output invalid json
-        self.first_result = None
-        self.len = 0
-        for p in self.gen():
-            if p is not None:
-                self.first_result = p
-                self.len = 1
-                break
+    def stream(self, document, indent=None, truncated_document=None):
+        head, tail = self.split(document, indent)
+        yield head
+
+        if indent:
+            # Every line of the list is indented as far as the line it's on
+            line = head[head.rfind('\n') + 1:]
+            outer = '\n' + line[:len(line) - len(line.lstrip())]
+
+        empty = True
+        for batch in self.batches():
+            items = dumps_list_items(batch, indent)
+            if indent:
+                items = items.replace('\n', outer)
+
+            yield ('[' if empty else ',') + items
+            empty = False
 
-    def __iter__(self):
-        return self.streamDicts()
+        if truncated_document is not None and self.truncated is not None and self.truncated():
+            _, tail = self.split(truncated_document, indent)
 
-    def __len__(self):
-        return self.len
+        if empty:
+            yield '[]' + tail
+        else:
+            yield (outer if indent else '') + ']' + tail
+
+    def split(self, document, indent):
+        """
+        The encoded document, either side of the results list. Anything added
+        for truncated_document sorts after the list, so the head is the same.
+        """
+        separators = None if indent else (',', ':')
+        return json.dumps(
+            document, indent=indent, sort_keys=True, separators=separators
+        ).split(json.dumps(results_marker))
+
+    def batches(self):
+        # The first result goes out on its own, rather than waiting on a
+        # whole batch behind it
+        batch = []
+        size = 1
+        for item in self.streamDicts():
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+                size = batch_size
+
+        if batch:
+            yield batch
+
+    def in_order(self, item):
+        """
+        Keys are written in the order they're in, which getItem() keeps
+        sorted. Fields tacked on the end (the baseline ones) are moved to
+        where sorting puts them, worked out once per layout of keys.
+        """
+        layout = tuple(item)
+        order = self.key_orders.get(layout)
+        if order is None:
+            order = self.key_orders[layout] = sorted(layout)
+
+        return {k: item[k] for k in order}
 
     def streamDicts(self):
         for p in self.gen():
@@ -119,4 +182,6 @@ class JSONStreamArray(list):
         p['browse'] = p['browse'][0] if len(p['browse']) > 0 else None
         p['absoluteOrbit'] = p['absoluteOrbit'][0] if len(p['absoluteOrbit']) > 0 else None
 
-        return dict((k, p[k]) for k in legacy_json_keys if k in p)
+        result = dict((k, p[k]) for k in legacy_json_keys if k in p)
+
+        return self.in_order(result) if self.includeBaseline else result
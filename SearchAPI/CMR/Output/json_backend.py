@@ -0,0 +1,41 @@
+import json
+import logging
+
+try:
+    import orjson
+except ImportError: # Optional, the standard library encoder does the same job, slower
+    orjson = None
+
+# Results are encoded this many at a time
+batch_size = 100
+
+
+def dumps(value, indent=None):
+    """
+    JSON text for value, indented 2 spaces (indent=2) or compact (None), the
+    two layouts both encoders can make. Keys come out in the order they're
+    in, nothing is sorted.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+        except TypeError as e:
+            logging.warning(f'orjson could not encode results, using json instead: {e}')
+
+    if indent:
+        return json.dumps(value, indent=2)
+
+    return json.dumps(value, separators=(',', ':'))
+
+
+def dumps_list_items(values, indent=None):
+    """
+    The items of a list as they'd appear in dumps(values), without the
+    brackets around them. With an indent, every item starts on a new line.
+    """
+    encoded = dumps(values, indent)
+
+    if indent:
+        return encoded[1:-2] # [\n  ...\n]
+
+    return encoded[1:-1]
@@ -1,6 +1,5 @@
 import logging
-import json
-from geomet import wkt
+from SearchAPI.CMR.Footprint import unwrap_shape, shape_to_wkt
 
 def req_fields_jsonlite():
     fields = [
@@ -27,6 +26,7 @@ def req_fields_jsonlite():
         'product_file_id',
         'relativeOrbit',
         'sensor',
+        'shape',
         'sizeMB',
         'startTime',
         'stopTime',
@@ -36,36 +36,24 @@ def req_fields_jsonlite():
     return fields
 
 
-from .json import JSONStreamArray
+from .json import JSONStreamArray, results_marker
 
-def cmr_to_jsonlite(rgen, includeBaseline=False, addendum=None):
+def cmr_to_jsonlite(rgen, includeBaseline=False, addendum=None, truncated=None):
     logging.debug('translating: jsonlite')
 
-    streamer = JSONLiteStreamArray(rgen, includeBaseline)
-    jsondata = {'results': streamer}
+    streamer = JSONLiteStreamArray(rgen, includeBaseline, truncated)
+    jsondata = {'results': results_marker}
     if addendum is not None:
         jsondata.update(addendum)
 
-    for p in json.JSONEncoder(indent=2, sort_keys=True).iterencode(jsondata):
+    for p in streamer.stream(jsondata, indent=2, truncated_document={**jsondata, 'truncated': True}):
         yield p
 
 
-def unwrap_wkt(wkt_str):
-    try:
-        wkt_obj = wkt.loads(wkt_str)
-        lons = [p[0] for p in wkt_obj['coordinates'][0]]
-        if(max(lons) - min(lons) > 180):
-            wkt_obj['coordinates'] = [[a if a[0] > 0 else [a[0] + 360, a[1]] for a in wkt_obj['coordinates'][0]]]
-        return wkt.dumps(wkt_obj, decimals=6)
-    except ValueError:
-        return wkt_str
-    return wkt_str
-
-
 class JSONLiteStreamArray(JSONStreamArray):
     def getItem(self, p):
         for i in p.keys():
-            if p[i] == 'NA' or p[i] == '':
+            if isinstance(p[i], str) and p[i] in ['NA', '']:
                 p[i] = None
         try:
             if float(p['offNadirAngle']) < 0:
@@ -123,8 +111,8 @@ class JSONLiteStreamArray(JSONStreamArray):
             'offNadirAngle': p['offNadirAngle'], # ALOS
             'orbit': p['absoluteOrbit'],
             'path': p['relativeOrbit'],
-            'polarization': p['polarization'],
             'pointingAngle': p['pointingAngle'],
+            'polarization': p['polarization'],
             'productID': p['product_file_id'],
             'productType': p['processingLevel'],
             'productTypeDisplay': p['processingTypeDisplay'],
@@ -134,11 +122,12 @@ class JSONLiteStreamArray(JSONStreamArray):
             'stopTime': p['stopTime'],
             'thumb': p['thumbnailUrl'],
             'wkt': p['stringFootprint'],
-            'wkt_unwrapped': unwrap_wkt(p['stringFootprint'])
+            'wkt_unwrapped': shape_to_wkt(unwrap_shape(p['shape']))
         }
 
         if self.includeBaseline:
             result['temporalBaseline'] = p['temporalBaseline']
             result['perpendicularBaseline'] = p['perpendicularBaseline']
+            result = self.in_order(result)
 
         return result
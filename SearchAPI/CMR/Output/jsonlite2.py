@@ -1,16 +1,16 @@
 import logging
-import json
+from .json import results_marker
 from .jsonlite import JSONLiteStreamArray, req_fields_jsonlite
 
 def req_fields_jsonlite2():
     return req_fields_jsonlite()
 
-def cmr_to_jsonlite2(rgen, includeBaseline=False, addendum=None):
+def cmr_to_jsonlite2(rgen, includeBaseline=False, addendum=None, truncated=None):
     logging.debug('translating: jsonlite')
 
-    streamer = JSONLite2StreamArray(rgen, includeBaseline)
+    streamer = JSONLite2StreamArray(rgen, includeBaseline, truncated)
 
-    for p in json.JSONEncoder(sort_keys=True, separators=(',', ':')).iterencode({'results': streamer}):
+    for p in streamer.stream({'results': results_marker}, truncated_document={'results': results_marker, 'truncated': True}):
         yield p
 
 class JSONLite2StreamArray(JSONLiteStreamArray):
@@ -36,8 +36,8 @@ class JSONLite2StreamArray(JSONLiteStreamArray):
             'o': p['orbit'],
             'on': p['offNadirAngle'], # ALOS
             'p': p['path'],
-            'pid': p['productID'].replace(p['granuleName'], '{gn}'),
             'pa': p['pointingAngle'],
+            'pid': p['productID'].replace(p['granuleName'], '{gn}'),
             'po': p['polarization'],
             'pt': p['productType'],
             'ptd': p['productTypeDisplay'],
@@ -53,5 +53,6 @@ class JSONLite2StreamArray(JSONLiteStreamArray):
         if self.includeBaseline:
             result['tb'] = p['temporalBaseline']
             result['pb'] = p['perpendicularBaseline']
+            result = self.in_order(result)
 
         return result
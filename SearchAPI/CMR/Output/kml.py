@@ -1,5 +1,6 @@
 import logging
 from jinja2 import Environment, PackageLoader
+from SearchAPI.CMR.Footprint import shape_points
 
 def req_fields_kml():
     fields = [
@@ -24,7 +25,7 @@ def req_fields_kml():
     ]
     return fields
 
-def cmr_to_kml(rgen, includeBaseline=False, addendum=None):
+def cmr_to_kml(rgen, includeBaseline=False, addendum=None, truncated=None):
     logging.debug('translating: kml')
 
     templateEnv = Environment(
@@ -33,5 +34,5 @@ def cmr_to_kml(rgen, includeBaseline=False, addendum=None):
     )
 
     template = templateEnv.get_template('template.kml')
-    for l in template.stream(includeBaseline=includeBaseline, results=rgen()):
+    for l in template.stream(includeBaseline=includeBaseline, results=rgen(), shape_points=shape_points):
         yield l
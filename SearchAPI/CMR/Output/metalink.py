@@ -10,7 +10,7 @@ def req_fields_metalink():
     ]
     return fields
 
-def cmr_to_metalink(rgen, includeBaseline=False, addendum=None):
+def cmr_to_metalink(rgen, includeBaseline=False, addendum=None, truncated=None):
     logging.debug('translating: metalink')
 
     templateEnv = Environment(
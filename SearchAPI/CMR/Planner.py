@@ -0,0 +1,207 @@
+import itertools
+import logging
+from math import ceil
+from urllib.parse import quote_plus
+
+from SearchAPI.CMR.Translate import input_map
+
+# these list parameters will be broken into chunks for subquerying
+chunk_lists = ['granule_list', 'product_list']
+chunk_size = 500 # when not sized by request body, see chunk_by_size()
+
+# CMR takes a list of values for these natively, so they dodge the subquery system
+native_list_params = ['platform']
+
+# Numeric parameters that CMR accepts ranges for, and the gap between
+# neighboring values that can be bridged when merging them into one range
+range_params = {
+    'absoluteorbit':    1,
+    'asfframe':         1,
+    'frame':            1,
+    'relativeorbit':    1,
+    'offnadirangle':    0,
+}
+
+
+def naive_subquery_count(params):
+    """
+    How many subqueries the plain cartesian product of the list
+    parameters would need, for reporting what the planner saved
+    """
+    count = 1
+
+    for k, v in params.items():
+        if not isinstance(v, list) or k in native_list_params:
+            continue
+        if k in chunk_lists:
+            count *= ceil(len(set(v)) / chunk_size)
+        else:
+            count *= len(v)
+
+    return count
+
+
+def subquery_list_from(params, chunk_bytes=None, max_chunk_len=None):
+    """
+    Use the cartesian product of all the list parameters to
+    determine subqueries, after packing as many values as CMR
+    can take into each one
+    """
+    logging.debug('Building subqueries using params:')
+    logging.debug(params)
+
+    subquery_params, list_params = {}, {}
+
+    for chunk_type in chunk_lists:
+        if chunk_type in params:
+            values = sorted(set(params[chunk_type])) # distinct, then split
+            if chunk_bytes is None:
+                params[chunk_type] = chunk_list(values, chunk_size)
+            else:
+                cmr_param = input_map()[chunk_type][0]
+                params[chunk_type] = chunk_by_size(values, cmr_param, chunk_bytes, max_chunk_len)
+
+    for k, v in params.items():
+        if k in range_params and isinstance(v, list):
+            params[k] = merge_ranges(v, adjacent=range_params[k])
+
+    or_params = or_list_params(params)
+    list_param_names = native_list_params + or_params
+
+    for k, v in params.items():
+        if k in list_param_names:
+            list_params[k] = v
+        else:
+            subquery_params[k] = v
+
+    sub_queries = cartesian_product(subquery_params)
+    formatted_list_params = format_list_params(list_params)
+
+    if or_params:
+        formatted_list_params += ({'options[attribute][or]': 'true'},)
+
+    final_sub_queries = [
+        query + formatted_list_params for query in sub_queries
+    ]
+
+    logging.debug(f'{len(final_sub_queries)} subqueries built')
+
+    return final_sub_queries
+
+
+def cartesian_product(params):
+    formatted_params = format_query_params(params)
+
+    return list(itertools.product(*formatted_params))
+
+
+def format_list_params(list_params):
+    formatted_params = sum(format_query_params(list_params), [])
+
+    return tuple(formatted_params)
+
+
+def format_query_params(params):
+    listed_params = []
+
+    for param_name, param_val in params.items():
+        plist = translate_param(param_name, param_val)
+        listed_params.append(plist)
+
+    return listed_params
+
+
+def translate_param(param_name, param_val):
+    param_list = []
+
+    cmr_input_map = input_map()
+
+    param_input_map = cmr_input_map[param_name]
+    cmr_param = param_input_map[0]
+    cmr_format_str = param_input_map[1]
+
+    if not isinstance(param_val, list):
+        param_val = [param_val]
+
+    for l in param_val:
+        format_val = l
+
+        if isinstance(l, list):
+            format_val = ','.join([f'{t}' for t in l])
+
+        param_list.append({
+            cmr_param: cmr_format_str.format(format_val)
+        })
+
+    return param_list
+
+
+def chunk_list(source_list, n):
+    return [source_list[i * n:(i + 1) * n] for i in range((len(source_list) + n - 1) // n)]
+
+
+def chunk_by_size(values, cmr_param, max_bytes, max_len=None):
+    """
+    Split a list into chunks whose form-encoded request bodies stay under
+    max_bytes (and hold at most max_len values), so short names pack more
+    to a request than long ones
+    """
+    chunks, chunk, size = [], [], 0
+    param_size = len(quote_plus(cmr_param)) + 2 # the = and &
+
+    for v in values:
+        v_size = param_size + len(quote_plus(v))
+
+        if chunk and (size + v_size > max_bytes or len(chunk) == max_len):
+            chunks.append(chunk)
+            chunk, size = [], 0
+
+        chunk.append(v)
+        size += v_size
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+def merge_ranges(values, adjacent):
+    """
+    Sort a list of numbers and [min, max] ranges, merging any that overlap
+    or sit within `adjacent` of each other: [1, 2, [3, 5], 9] -> [[1, 5], 9]
+    """
+    spans = sorted(
+        (v[0], v[1]) if isinstance(v, list) else (v, v)
+        for v in values
+    )
+
+    merged = []
+    for low, high in spans:
+        if merged and low <= merged[-1][1] + adjacent:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+
+    return [low if low == high else [low, high] for low, high in merged]
+
+
+def or_list_params(params):
+    """
+    CMR ANDs attribute[] params together unless told to OR all of them with
+    options[attribute][or]. So if exactly one parameter is searched by
+    attribute, all of its values can be packed into a single request.
+    """
+    cmr_input_map = input_map()
+
+    attribute_params = [
+        k for k in params if cmr_input_map[k][0] == 'attribute[]'
+    ]
+
+    if len(attribute_params) != 1:
+        return []
+
+    k = attribute_params[0]
+    if not isinstance(params[k], list) or len(params[k]) <= 1:
+        return []
+
+    return [k]
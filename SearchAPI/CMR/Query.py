@@ -1,21 +1,31 @@
-import itertools
+import heapq
 import logging
-import time
+from concurrent.futures import wait
 
 from SearchAPI.asf_env import get_config
+from SearchAPI.asf_deadline import get_deadline, DeadlineExceeded
 
-from SearchAPI.CMR.Translate import input_map
 from SearchAPI.CMR.SubQuery import CMRSubQuery
+from SearchAPI.CMR.Concurrency import CMRLimiter, TaskGate, shared_executor
+from SearchAPI.CMR.Planner import subquery_list_from, naive_subquery_count
+from SearchAPI.CMR.Lookup import RecentLookups, lookup_param, lookup_fields
+from SearchAPI.CMR.Exceptions import CMRError
 from flask import request
 
 
 class CMRQuery:
-    def __init__(self, req_fields, params=None, max_results=None):
+    def __init__(self, req_fields, params=None, max_results=None, cache_lookups=True):
         cfg = get_config()
 
         self.max_results = max_results
-        self.req_fields = req_fields
+        # The fields CMR sorts on are needed to merge subquery results
+        self.req_fields = req_fields + [
+            f for f in sort_fields if f not in req_fields
+        ]
         self.page_size = cfg['cmr_page_size']
+        self.concurrency = cfg['cmr_query_concurrency']
+        self.global_concurrency = cfg['cmr_global_concurrency']
+        self.count_timeout = cfg['cmr_count_timeout']
         self.params = params
 
         provider = request.args.get("cmr_provider")
@@ -26,25 +36,50 @@ class CMRQuery:
             {'provider': provider},  # always limit the results to a provider, default 'ASF'
             {'page_size': self.max_results if self.is_small_max_results() else self.page_size},  # page size to request from CMR
             {'options[temporal][and]': 'true'}, # Makes handling date ranges easier
-            {'sort_key[]': '-end_date'}, # Sort CMR results, but this is partially defeated by the subquery system
+            {'sort_key[]': '-end_date'}, # Sort CMR results, subquery results are merged back into this order
             {'sort_key[]': 'granule_ur'}, # Secondary sort key, the order these keys are specified in matters! This is to make multiple granules with the same date sort consistently
             {'options[platform][ignore_case]': 'true'}
         ]
 
         self.result_counter = 0
+        self.truncated = False
+        self.deadline = get_deadline()
 
-        time_in_seconds = 14.5 * 60
-        current_time = time.time()
-        self.cutoff_time = current_time + time_in_seconds
+        self.limiter = CMRLimiter(
+            query_limit=self.concurrency,
+            global_limit=self.global_concurrency
+        )
+
+        naive_count = naive_subquery_count(self.params)
+
+        # granule_list/product_list: serve what we can from recent lookups,
+        # and only ask CMR about the rest
+        self.lookups = None
+        self.cached_results = []
+        param = lookup_param(self.params)
+        if param is not None and cache_lookups:
+            self.req_fields += [f for f in lookup_fields[param] if f not in self.req_fields]
+            # Any other filter on the search changes what a name finds too
+            filters = tuple(sorted((k, repr(v)) for k, v in self.params.items() if k != param))
+            self.lookups = RecentLookups(
+                cfg, param,
+                scope=(cfg['cmr_base'], provider, request.args.get('cmr_token'), tuple(self.req_fields), filters)
+            )
+            self.cached_results, self.params[param] = self.lookups.split(self.params[param])
+            self.cached_results.sort(key=result_sort_key)
 
         self.sub_queries = [
-            CMRSubQuery(
-                self.req_fields,
-                params=list(query),
-                extra_params=self.extra_params
+            self.build_subquery(query) for query in subquery_list_from(
+                self.params,
+                chunk_bytes=cfg['cmr_lookup_chunk_bytes'],
+                max_chunk_len=cfg['cmr_max_page_size']
             )
-            for query in subquery_list_from(self.params)
         ]
+        self.subqueries_eliminated = naive_count - len(self.sub_queries)
+
+        logging.debug(f'Planner eliminated {self.subqueries_eliminated} of {naive_count} subqueries')
+        request.cmr_subqueries_eliminated = \
+            getattr(request, 'cmr_subqueries_eliminated', 0) + self.subqueries_eliminated
 
         logging.debug('New CMRQuery object ready to go')
 
@@ -54,40 +89,149 @@ class CMRQuery:
             self.max_results < self.page_size
         )
 
+    def build_subquery(self, query):
+        return CMRSubQuery(
+            self.req_fields,
+            params=list(query),
+            extra_params=self.extra_params,
+            limiter=self.limiter,
+            max_results=self.max_results
+        )
+
     def get_count(self):
-        return sum([sq.get_count() for sq in self.sub_queries])
+        gate = TaskGate(shared_executor(self.global_concurrency), self.concurrency)
+        futures = [gate.submit(sq.get_count) for sq in self.sub_queries]
 
-    def get_results(self):
-        for query_num, subquery in enumerate(self.sub_queries):
-            logging.debug(f'Running subquery {query_num+1}')
+        timeout = min(self.count_timeout, self.deadline.remaining())
+        _, not_done = wait(futures, timeout=timeout)
 
-            # taking a page at a time from each subquery,
-            # yield one result at a time until we max out
-            for result in subquery.get_results():
-                if self.is_out_of_time():
-                    logging.warning('Query ran too long, terminating')
-                    logging.warning(self.params)
-                    return
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            logging.warning(f'Count timed out after {timeout:.1f} seconds')
+            logging.warning(self.params)
+            if self.deadline.expired():
+                raise DeadlineExceeded(f'Ran out of time counting results after {timeout:.1f} seconds')
+            raise CMRError(f'Timed out counting results after {timeout:.1f} seconds')
 
-                if self.max_results_reached():
-                    logging.debug('Max results reached, terminating')
-                    return
+        return len(self.cached_results) + sum(future.result() for future in futures)
 
-                if result is None:
-                    continue
+    def get_results(self):
+        # Every CMR call runs on the shared executor, this query's share of
+        # it capped at cmr_query_concurrency
+        gate = TaskGate(shared_executor(self.global_concurrency), self.concurrency)
+        started = []
+        streams = []
+
+        try:
+            started = self.start_subqueries(gate)
+            logging.debug(f'Running {len(started)} of {len(self.sub_queries)} subqueries, {self.concurrency} at a time')
+
+            streams = [self.subquery_results(subquery, pages) for subquery, pages in started]
+            streams.append(r for r in self.cached_results)
+
+            yield from self.consume(streams)
+        except DeadlineExceeded as e:
+            if not self.deadline.expired():
+                raise
+            # Out of time mid-page: end the results here rather than erroring
+            # out part way through a response that's already streaming
+            logging.warning(f'Query ran out of time, terminating: {e}')
+            logging.warning(self.params)
+            self.truncated = True
+        finally:
+            for stream in streams:
+                stream.close()
+            # Not every stream got far enough to close its own pages
+            for _, pages in started:
+                pages.close()
+
+    def start_subqueries(self, gate):
+        """
+        Every subquery starts fetching right away, the gate holds them to
+        their turn. Even with maxresults they all have to run: the top
+        results of the merge could come from any of them.
+        """
+        return [(subquery, subquery.start(gate.submit)) for subquery in self.sub_queries]
+
+    def get_page(self, page_size, position=None):
+        """
+        One page of results for cursor paging, starting from position (a
+        subquery index and the CMR-Search-After value within it). Subqueries
+        are paged through in turn rather than merged, a merged position
+        would need a search-after for every one of them. Returns the results
+        and where the next page starts, or None if this was the last one.
+        """
+        index, search_after = position or (0, None)
+        results = []
+
+        while index < len(self.sub_queries) and len(results) < page_size:
+            wanted = page_size - len(results)
+            page, search_after = self.sub_queries[index].get_page_after(search_after, wanted)
+            results.extend(page)
+
+            if len(page) < wanted:
+                index, search_after = index + 1, None
+
+        if index >= len(self.sub_queries):
+            return results, None
+
+        return results, (index, search_after)
+
+    def subquery_results(self, subquery, pages):
+        if self.lookups is None:
+            return subquery.get_results(pages)
+
+        return self.remember_lookups(subquery, pages)
+
+    def remember_lookups(self, subquery, pages):
+        """
+        Pass a lookup subquery's results through, and once we've seen all of
+        them, remember what each name found
+        """
+        names = [v for k, v in subquery.params if k in ['readable_granule_name[]', 'granule_ur[]']]
+        records = []
+
+        for r in subquery.get_results(pages):
+            if r is not None:
+                records.append(r.copy())
+            yield r
+
+        if len(records) >= subquery.hits:
+            self.lookups.remember(names, records)
+
+    def consume(self, streams):
+        # Each subquery comes back from CMR already sorted, merge them a
+        # result at a time so the combined output is sorted the same way
+        results = heapq.merge(
+            *[(r for r in stream if r is not None) for stream in streams],
+            key=result_sort_key
+        )
+
+        # yield one result at a time until we max out
+        for result in results:
+            if self.is_out_of_time():
+                logging.warning('Query ran too long, terminating')
+                logging.warning(self.params)
+                self.truncated = True
+                return
 
-                self.result_counter += 1
-                yield result
+            if self.max_results_reached():
+                logging.debug('Max results reached, terminating')
+                return
 
-                # it's a little silly but run this check again here so we don't accidentally fetch an extra page
-                if self.max_results_reached():
-                    logging.debug('Max results reached, terminating')
-                    return
+            self.result_counter += 1
+            yield result
 
-            logging.debug('End of available results reached')
+            # it's a little silly but run this check again here so we don't accidentally fetch an extra page
+            if self.max_results_reached():
+                logging.debug('Max results reached, terminating')
+                return
+
+        logging.debug('End of available results reached')
 
     def is_out_of_time(self):
-        return time.time() > self.cutoff_time
+        return self.deadline.expired()
 
     def max_results_reached(self):
         return (
@@ -96,86 +240,36 @@ class CMRQuery:
         )
 
 
-def subquery_list_from(params):
-    """
-    Use the cartesian product of all the list parameters to
-    determine subqueries
-    """
-    logging.debug('Building subqueries using params:')
-    logging.debug(params)
-
-    subquery_params, list_params = {}, {}
-
-    def chunk_list(source_list, n):
-        return [source_list[i * n:(i + 1) * n] for i in range((len(source_list) + n - 1) // n)]
-
-    chunk_lists = ['granule_list', 'product_list'] # these list parameters will be broken into chunks for subquerying
-    for chunk_type in chunk_lists:
-        if chunk_type in params:
-            params[chunk_type] = chunk_list(list(set(params[chunk_type])), 500) # distinct and split
+# Fields matching the sort_key[] params sent to CMR
+sort_fields = ['stopTime', 'product_file_id']
 
-    list_param_names = ['platform'] # these parameters will dodge the subquery system
 
-    for k, v in params.items():
-        if k in list_param_names:
-            list_params[k] = v
-        else:
-            subquery_params[k] = v
-
-    sub_queries = cartesian_product(subquery_params)
-    formatted_list_params = format_list_params(list_params)
-
-    final_sub_queries = [
-        query + formatted_list_params for query in sub_queries
-    ]
-
-    logging.debug(f'{len(final_sub_queries)} subqueries built')
-
-    return final_sub_queries
-
-
-def cartesian_product(params):
-    formatted_params = format_query_params(params)
-
-    return list(itertools.product(*formatted_params))
-
-
-def format_list_params(list_params):
-    formatted_params = sum(format_query_params(list_params), [])
-
-    return tuple(formatted_params)
-
-
-def format_query_params(params):
-    listed_params = []
-
-    for param_name, param_val in params.items():
-        plist = translate_param(param_name, param_val)
-        listed_params.append(plist)
-
-    return listed_params
+def result_sort_key(result):
+    """
+    Newest end date first, then granule_ur, same as CMR
+    """
+    return (Descending(normalize_date(result['stopTime'])), result['product_file_id'] or '')
 
 
-def translate_param(param_name, param_val):
-    param_list = []
+def normalize_date(date):
+    # CMR isn't consistent about fractional seconds, pad them out so dates
+    # from different collections compare correctly as strings
+    if date is None:
+        return ''
 
-    cmr_input_map = input_map()
+    seconds, _, fraction = date.rstrip('Z').partition('.')
 
-    param_input_map = cmr_input_map[param_name]
-    cmr_param = param_input_map[0]
-    cmr_format_str = param_input_map[1]
+    return f'{seconds}.{fraction:0<6}'
 
-    if not isinstance(param_val, list):
-        param_val = [param_val]
 
-    for l in param_val:
-        format_val = l
+class Descending:
+    __slots__ = ['value']
 
-        if isinstance(l, list):
-            format_val = ','.join([f'{t}' for t in l])
+    def __init__(self, value):
+        self.value = value
 
-        param_list.append({
-            cmr_param: cmr_format_str.format(format_val)
-        })
+    def __lt__(self, other):
+        return other.value < self.value
 
-    return param_list
+    def __eq__(self, other):
+        return self.value == other.value
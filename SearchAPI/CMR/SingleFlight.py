@@ -0,0 +1,65 @@
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import logging
+import threading
+
+import requests
+
+from SearchAPI.asf_deadline import DeadlineExceeded
+
+
+class SingleFlight:
+    """
+    Coalesces identical calls made at the same time: the first caller for a
+    key starts the work, anyone who asks for the same key while it's still
+    in flight shares that result (or exception).
+
+    The call runs on its own executor, not in the first caller's thread, so
+    it isn't tied to any one caller's deadline: everybody, first caller
+    included, waits for it as long as their own deadline allows.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn, executor, deadline):
+        while True:
+            with self.lock:
+                call = self.calls.get(key)
+                leader = call is None
+                if leader:
+                    call = executor.submit(fn)
+                    self.calls[key] = call
+
+            if leader:
+                call.add_done_callback(lambda _, call=call: self.forget(key, call))
+            else:
+                logging.debug('Identical request already in flight, waiting on it')
+
+            try:
+                return call.result(timeout=deadline.remaining())
+            except FutureTimeoutError:
+                raise DeadlineExceeded('Request ran past its deadline waiting on CMR')
+            except (requests.Timeout, DeadlineExceeded):
+                if leader or deadline.expired():
+                    raise
+                # Someone else's call ran out of time, that's no reason for
+                # ours to fail: make it again
+                logging.warning('Shared CMR request timed out, sending it again')
+                self.forget(key, call)
+
+    def forget(self, key, call):
+        with self.lock:
+            if self.calls.get(key) is call:
+                del self.calls[key]
+
+
+def request_key(url, params, headers):
+    """
+    Normalized key for a CMR request. Param order matters to CMR (sort keys),
+    so it's kept as is, headers aren't ordered.
+    """
+    return (
+        url,
+        tuple((k, str(v)) for k, v in params),
+        tuple(sorted(headers.items()))
+    )
@@ -1,26 +1,50 @@
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+from datetime import datetime
+import itertools
 import logging
-from math import ceil
 import re
+import time
 from time import sleep, perf_counter
 
 import requests
 from flask import request
 
 from SearchAPI.asf_env import get_config
-from SearchAPI.CMR.Translate import parse_cmr_response
+from SearchAPI.asf_deadline import get_deadline, DeadlineExceeded
+from SearchAPI.asf_session import get_session
+from SearchAPI.CMR.Translate import parse_cmr_response, parse_cmr_page
 from SearchAPI.CMR.Exceptions import CMRError
+from SearchAPI.CMR.Concurrency import PrefetchStream, call_executor, parse_pool, discard_parse_pool
+from SearchAPI.CMR.SingleFlight import SingleFlight, request_key
+from SearchAPI.CMR.Cache import CachedPage, CachedCount, page_cache, count_cache
+from SearchAPI.CMR.CircuitBreaker import cmr_breaker, retry_budget, backoff
+from SearchAPI.CMR.Hedging import hedged, request_kind
+
+# Identical CMR requests made at the same time (say, a popular search loaded
+# by a bunch of users at once) share a single call to CMR
+in_flight = SingleFlight()
 
 
 class CMRSubQuery:
-    def __init__(self, req_fields, params, extra_params):
+    def __init__(self, req_fields, params, extra_params, limiter=None, max_results=None):
         self.params = params
         self.extra_params = extra_params
         self.req_fields = req_fields
+        self.limiter = limiter
+        self.max_results = max_results
         self.hits = 0
         self.results = []
+        self.search_after = None
 
         self.params = self.combine_params(self.params, self.extra_params)
 
+        # Subqueries may run outside the request context, hang on to the config
+        self.cfg = get_config()
+        self.deadline = get_deadline()
+
         self.headers = {}
         
         token = request.args.get("cmr_token")
@@ -37,6 +61,30 @@ class CMRSubQuery:
             if 'page_size' in param:
                 return param[1]
 
+    def page_params(self, page_size):
+        return [
+            param for param in self.params
+            if param[0] not in ['page_size']
+        ] + [('page_size', page_size)]
+
+    def result_target(self):
+        if self.max_results is None:
+            return self.hits
+        return min(self.hits, self.max_results)
+
+    def next_page_size(self, remaining):
+        """
+        The first page is kept small so results start flowing quickly, after
+        that we know how much is left: ask for exactly that, in pages as big
+        as CMR allows
+        """
+        return min(remaining, self.cfg['cmr_max_page_size'])
+
+    def limit(self):
+        if self.limiter is None:
+            return nullcontext()
+        return self.limiter
+
     def combine_params(self, params, extra_params):
         fixed = []
         for p in params + extra_params:
@@ -86,95 +134,351 @@ class CMRSubQuery:
             )
 
     def get_count(self):
-        params = [
-            param for param in self.params
-            if param[0] not in ['page_size']
-        ]
-        params.append(('page_size', 0))
-
-        session = self.asf_session()
+        params = self.page_params(0)
         url = self.cmr_api_url()
-
-        cmr_request = session.post(url, data=params, headers=self.headers)
+        headers = self.request_headers(paging=False)
+
+        if self.cfg['cmr_count_cache_ttl'] <= 0:
+            self.hits = self.count(url, params, headers)
+            return self.hits
+
+        key = request_key(url, params, headers)
+        cache = count_cache(self.cfg)
+        cached = cache.get(key)
+
+        if cached is not None:
+            age = time.time() - cached.checked_at
+            if age < self.cfg['cmr_count_cache_ttl']:
+                logging.debug(f'Count served from cache, {age:.0f} seconds old')
+                self.hits = cached.hits
+                return self.hits
+
+            if self.unchanged_since(url, params, headers, cached.checked_at):
+                logging.debug('Cached count revalidated, nothing updated since')
+                self.hits = cached.hits
+                self.cache_count(key, cached.hits, time.time())
+                return self.hits
+
+        checked_at = time.time()
+        self.hits = self.count(url, params, headers)
+        self.cache_count(key, self.hits, checked_at)
+
+        return self.hits
+
+    def count(self, url, params, headers):
+        try:
+            cmr_request = self.post(url, params, headers)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            if self.deadline.expired():
+                raise DeadlineExceeded(f'Request ran past its {self.deadline.seconds} second deadline') from e
+            raise CMRError(f'CMR did not respond to a count: {e}')
 
         if 'CMR-hits' not in cmr_request.headers:
             raise CMRError(cmr_request.text)
 
-        self.hits = int(cmr_request.headers['CMR-hits'])
+        hits = int(cmr_request.headers['CMR-hits'])
 
-        logging.debug(f'CMR reported {self.hits} hits')
+        logging.debug(f'CMR reported {hits} hits')
 
-        return int(cmr_request.headers['CMR-hits'])
+        return hits
 
-    def get_results(self):
-        logging.debug('Processing page 1')
+    def unchanged_since(self, url, params, headers, checked_at):
+        """
+        Cheap check that a cached count still holds: ask CMR whether anything
+        matching the search was added or updated since we last counted, same
+        as the processingdate param does. Deletions don't show up this way,
+        which is why cached counts still expire after cmr_count_cache_max_age.
+        """
+        if any(k == 'updated_since' for k, _ in params):
+            return False
 
-        session = self.asf_session()
-        response = self.get_page(session)
+        since = datetime.utcfromtimestamp(checked_at).strftime('%Y-%m-%dT%H:%M:%SZ')
 
-        if response is None:
+        return self.count(url, params + [('updated_since', since)], headers) == 0
+
+    def cache_count(self, key, hits, checked_at):
+        count_cache(self.cfg).put(
+            key, CachedCount(hits, checked_at),
+            nbytes=len(repr(key)),
+            ttl=self.cfg['cmr_count_cache_max_age']
+        )
+
+    def start(self, submit):
+        """
+        Start fetching pages through submit, a couple ahead of whoever reads
+        them, so CMR latency overlaps with parsing/serializing instead of
+        adding to it. get_results() parses what comes back.
+        """
+        return PrefetchStream(
+            self.fetch_pages(),
+            submit,
+            depth=self.cfg['cmr_prefetch_pages']
+        )
+
+    def get_results(self, pages):
+        try:
+            # How many results there are is known once the first page is in
+            remaining = iter(pages)
+            first = next(remaining, None)
+            if first is not None:
+                in_order = itertools.chain([first], remaining)
+                if self.use_parse_pool():
+                    yield from self.parse_in_pool(in_order)
+                else:
+                    yield from self.parse_in_thread(in_order)
+        finally:
+            pages.close()
+
+        logging.debug(f'Done fetching results: got {len(self.results)}/{self.hits}')
+
+        return
+
+    def use_parse_pool(self):
+        """
+        Big exports are bound by parsing, which a single thread can only do
+        so much of. Off unless configured, not every host can run processes.
+        """
+        return (
+            self.cfg['cmr_parse_processes'] > 0 and
+            self.result_target() >= self.cfg['cmr_parse_pool_min_results']
+        )
+
+    def parse_in_thread(self, pages):
+        for page_num, (key, page) in enumerate(pages, start=1):
+            if isinstance(page, CachedPage):
+                logging.debug(f'Page {page_num} served from cache')
+
+                # Translators modify results in place, hand out copies
+                for p in page.records:
+                    yield p.copy()
+                continue
+
+            logging.debug(f'Parsing page {page_num}')
+
+            records = []
+            for p in parse_cmr_response(page, self.req_fields):
+                records.append(p.copy())
+                yield p
+
+            logging.debug(f'Parsing page {page_num} complete')
+
+            self.cache_page(key, page, records)
+
+    def parse_in_pool(self, pages):
+        """
+        Raw pages go out to worker processes as they arrive, up to one per
+        worker at a time, and come back as records. Records are handed out
+        in page order, as soon as the page they're on is done.
+        """
+        size = self.cfg['cmr_parse_processes']
+        pool = parse_pool(size)
+        req_fields = tuple(self.req_fields)
+        window = deque()
+
+        logging.debug(f'Parsing {self.result_target()} results in {size} processes')
+
+        try:
+            for key, page in pages:
+                parsed = None
+                if not isinstance(page, CachedPage):
+                    try:
+                        parsed = pool.submit(parse_cmr_page, page.content, req_fields)
+                    except BrokenProcessPool:
+                        logging.error('CMR parsing pool is broken, parsing here instead')
+                        discard_parse_pool(pool)
+                        pool = parse_pool(size)
+
+                window.append((key, page, parsed))
+
+                while window and (len(window) > size or self.page_ready(*window[0])):
+                    yield from self.finish_page(*window.popleft())
+
+            while window:
+                yield from self.finish_page(*window.popleft())
+        finally:
+            for _, _, parsed in window:
+                if parsed is not None:
+                    parsed.cancel()
+
+    @staticmethod
+    def page_ready(key, page, parsed):
+        return parsed is None or parsed.done()
+
+    def finish_page(self, key, page, parsed):
+        if isinstance(page, CachedPage):
+            for p in page.records:
+                yield p.copy()
             return
 
+        records = None
+        if parsed is not None:
+            try:
+                records = parsed.result(timeout=self.deadline.remaining())
+            except FutureTimeoutError:
+                raise DeadlineExceeded('Request ran past its deadline waiting on parsing')
+            except BrokenProcessPool:
+                logging.error('CMR parsing process died, parsing here instead')
+
+        if records is None:
+            records = list(parse_cmr_response(page, self.req_fields))
+
+        self.cache_page(key, page, [p.copy() for p in records])
+
+        yield from records
+
+    def get_page_after(self, search_after, page_size):
+        """
+        A single page of parsed results picking up from a CMR-Search-After
+        value, and the value to carry on from
+        """
+        self.search_after = search_after
+        response = self.get_page(page_size)
+
+        if response is None:
+            raise CMRError('Could not fetch a page of results from CMR')
+
         self.hits = int(response.headers['CMR-hits'])
+        results = list(parse_cmr_response(response, self.req_fields))
 
-        logging.debug('Parsing page 1')
+        return results, self.search_after
 
-        for p in parse_cmr_response(response, self.req_fields):
-            yield p
+    def fetch_pages(self):
+        logging.debug('Processing page 1')
+
+        # Every run starts from the top
+        self.search_after = None
+
+        page_size = self.get_page_size()
+        key, response = self.fetch_page(0, page_size)
+
+        if response is None:
+            return
 
-        hits = float(self.hits)
-        page_size = float(self.get_page_size())
-        num_pages = int(ceil(hits / page_size)) + 1
+        yield key, response
 
-        logging.debug(f'Planning to fetch additional {num_pages} pages')
+        fetched = page_size
+        target = self.result_target()
 
-        # fetch multiple pages of results if needed, yield a product at a time
-        for page_num in range(2, num_pages):
+        logging.debug(f'Planning to fetch {max(target - fetched, 0)} more results')
+
+        # fetch multiple pages of results if needed, a page at a time
+        page_num = 2
+        while fetched < target:
             logging.debug(f'Processing page {page_num}')
 
-            page = self.get_page(session)
+            page_size = self.next_page_size(target - fetched)
+            key, page = self.fetch_page(fetched, page_size)
 
-            logging.debug(f'Parsing page {page_num}')
+            if page is None:
+                return
 
-            for parsed_page in parse_cmr_response(page, self.req_fields):
-                yield parsed_page
+            yield key, page
 
-            logging.debug(f'Parsing page {page_num} complete')
             logging.debug(f'Processing page {page_num} complete')
 
-        logging.debug(f'Done fetching results: got {len(self.results)}/{self.hits}')
+            fetched += page_size
+            page_num += 1
 
-        return
+    def fetch_page(self, offset, page_size):
+        """
+        Get a page from the cache if we can, otherwise from CMR
+        """
+        key = self.page_cache_key(offset, page_size)
+
+        if self.use_page_cache():
+            cached = page_cache(self.cfg).get(key)
+            if cached is not None:
+                self.hits = cached.hits
+                self.search_after = cached.search_after
+                return key, cached
+
+        response = self.get_page(page_size)
+
+        if response is not None:
+            self.hits = int(response.headers['CMR-hits'])
+
+        return key, response
+
+    def use_page_cache(self):
+        return self.cfg['cmr_page_cache_ttl'] > 0
+
+    def page_cache_key(self, offset, page_size):
+        # Same search, same spot in the results, same fields parsed out
+        return (
+            request_key(
+                self.cmr_api_url(),
+                self.page_params(page_size),
+                self.request_headers(paging=False)
+            ),
+            offset,
+            tuple(self.req_fields)
+        )
+
+    def cache_page(self, key, response, records):
+        if not self.use_page_cache():
+            return
+
+        hits = int(response.headers['CMR-hits'])
 
-    def get_page(self, session):
+        # Don't remember a page we failed to parse
+        if len(records) == 0 and hits > 0:
+            return
+
+        page = CachedPage(records, hits, response.headers.get('CMR-Search-After'))
+        page_cache(self.cfg).put(
+            key, page,
+            nbytes=len(response.content),
+            ttl=self.cfg['cmr_page_cache_ttl']
+        )
+
+    def get_page(self, page_size):
         max_retry = 3
+        params = self.page_params(page_size)
 
-        # Sometimes CMR is on the fritz, retry for a bit
+        # Sometimes CMR is on the fritz, retry for a bit, as long as the
+        # process as a whole isn't already retrying too much
         for attempt in range(max_retry):
+            if attempt > 0:
+                if not retry_budget(self.cfg).withdraw():
+                    logging.error('Retry budget exhausted, not retrying')
+                    break
+
+                # Give CMR a chance to sort itself out
+                sleep(min(backoff(attempt), self.deadline.remaining()))
+
             q_start = perf_counter()
 
             api_url = self.cmr_api_url()
-            response = session.post(api_url, data=self.params, headers=self.headers)
+            headers = self.request_headers()
+            try:
+                response = self.post(api_url, params, headers, hedge=self.use_hedging())
+            except (requests.Timeout, requests.ConnectionError) as e:
+                # One slow or dropped call is worth another go, if there's
+                # still time for it
+                if self.deadline.expired():
+                    raise DeadlineExceeded(f'Request ran past its {self.deadline.seconds} second deadline') from e
+
+                logging.warning(f'CMR request failed (attempt {attempt + 1} of {max_retry}): {e}')
+                continue
+
+            # The session is shared, so the paging state lives on the subquery
+            if 'CMR-Search-After' in response.headers:
+                self.search_after = response.headers['CMR-Search-After']
 
-            if 'CMR-Search-After' in response.headers:            
-                session.headers.update({'CMR-Search-After': response.headers['CMR-Search-After']})
-        
             query_duration = perf_counter() - q_start
             logging.debug(f'CMR query time: {query_duration}')
 
             if query_duration > 10:
-                self.log_slow_cmr_response(session, response, query_duration)
+                self.log_slow_cmr_response(headers, response, query_duration)
 
             if response.status_code != 200:
                 self.log_bad_cmr_response(
-                    attempt, max_retry, response, session
+                    attempt, max_retry, response, headers
                 )
                 if response.status_code == 404:
                     logging.error('Halting without retries due to 404')
                     break
 
-                # CMR a chance to sort itself out
-                sleep(0.5)
                 continue
             
             logging.debug('Page fetch complete')
@@ -183,32 +487,74 @@ class CMRSubQuery:
         logging.error('Max number of retries reached, moving on')
         return
 
-    def asf_session(self):
-        session = requests.Session()
-        headers = get_config()['cmr_headers']
-        session.headers.update(headers)
-        logging.debug('New requests.Session with headers:')
-        logging.debug(session.headers)
+    def post(self, url, params, headers, hedge=False):
+        # Identical requests from other queries may share this one, so it's
+        # given CMR's usual timeout rather than whatever this query has left
+        timeout = (self.cfg['http_connect_timeout'], self.cfg['cmr_request_timeout'])
+
+        def call():
+            return get_session().post(url, data=params, headers=headers, timeout=timeout)
+
+        def send():
+            breaker = cmr_breaker(self.cfg)
+            trial = breaker.check()
+
+            try:
+                retry_budget(self.cfg).deposit()
+
+                with self.limit():
+                    try:
+                        response = hedged(call, url, self.cfg, request_kind(params), self.limiter) if hedge else call()
+                    except requests.RequestException:
+                        breaker.record(True, trial)
+                        raise
+
+                # Client errors are our fault (or the user's), not a sign CMR is unwell
+                failed = response.status_code >= 500 or response.status_code == 429
+                breaker.record(failed, trial)
+
+                return response
+            finally:
+                # However the call ended, it mustn't leave the circuit
+                # waiting on a trial that's over
+                breaker.release(trial)
+
+        if self.deadline.expired():
+            raise DeadlineExceeded(f'Request ran past its {self.deadline.seconds} second deadline')
+
+        return in_flight.do(
+            request_key(url, params, headers), send,
+            executor=call_executor(self.cfg['cmr_global_concurrency']),
+            deadline=self.deadline
+        )
 
-        return session
+    def use_hedging(self):
+        return self.cfg['cmr_hedge_percentile'] > 0
 
-    def cmr_api_url(self):
-        cfg = get_config()
+    def request_headers(self, paging=True):
+        headers = dict(self.cfg['cmr_headers'])
+        headers.update(self.headers)
+
+        if paging and self.search_after is not None:
+            headers['CMR-Search-After'] = self.search_after
 
-        base, path = cfg['cmr_base'], cfg['cmr_api']
+        return headers
+
+    def cmr_api_url(self):
+        base, path = self.cfg['cmr_base'], self.cfg['cmr_api']
         url = f'{base}{path}'
 
         return url
 
-    def log_slow_cmr_response(self, session, response, response_time):
+    def log_slow_cmr_response(self, headers, response, response_time):
         logging.error(f'Slow CMR response: {response_time} seconds')
         logging.error('Params sent to CMR:')
         logging.error(self.params)
         logging.error('Headers sent to CMR:')
-        logging.error(session.headers)
+        logging.error(headers)
         logging.error(f'Response code: {response.status_code}')
 
-    def log_bad_cmr_response(self, attempt, max_retry, response, session):
+    def log_bad_cmr_response(self, attempt, max_retry, response, headers):
         logging.error(
             f'Bad news bears! CMR said {response.status_code}'
         )
@@ -216,5 +562,5 @@ class CMRSubQuery:
         logging.error('Params sent to CMR:')
         logging.error(self.params)
         logging.error('Headers sent to CMR:')
-        logging.error(session.headers)
+        logging.error(headers)
         logging.error(f'Error body: {response.text}')
@@ -1,5 +1,5 @@
 from .input_map import input_map
-from .parse_cmr_response import parse_cmr_response
+from .parse_cmr_response import parse_cmr_response, parse_cmr_page
 from .translate_params import translate_params
 from .input_fixer import input_fixer
 from .fields import get_field_paths
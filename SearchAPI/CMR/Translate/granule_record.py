@@ -0,0 +1,122 @@
+from functools import lru_cache
+
+
+class GranuleRecord:
+    """
+    A parsed granule. Reads and writes like the dict it replaces, so output
+    translators and the baseline code can keep indexing, updating and
+    popping it, but the fields parse_granule fills in live in __slots__ on
+    a class made for that set of fields. Anything else set on it later
+    (temporalBaseline and friends) goes in a small overflow dict.
+    """
+    __slots__ = ['_extra']
+    _fields = ()
+    _field_set = frozenset()
+
+    def __init__(self, values):
+        self._extra = None
+        for k, v in values.items():
+            self[k] = v
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            setattr(self, key, value)
+            return
+
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+
+        if key in self._field_set:
+            delattr(self, key)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+
+        del self[key]
+        return value
+
+    def keys(self):
+        keys = [k for k in self._fields if hasattr(self, k)]
+        if self._extra is not None:
+            keys.extend(self._extra)
+        return keys
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def copy(self):
+        record = self.__class__.__new__(self.__class__)
+        record._extra = dict(self._extra) if self._extra is not None else None
+        for k in self._fields:
+            if hasattr(self, k):
+                setattr(record, k, getattr(self, k))
+        return record
+
+    def __eq__(self, other):
+        return dict(self.items()) == dict(other.items())
+
+    def __repr__(self):
+        return f'GranuleRecord({dict(self.items())})'
+
+    def __reduce__(self):
+        # The class is made on the fly, so rebuild it by its fields
+        return (make_record, (self._fields, dict(self.items())))
+
+
+@lru_cache(maxsize=None)
+def record_class(fields):
+    return type('GranuleRecord', (GranuleRecord,), {
+        '__slots__': list(fields),
+        '_fields': fields,
+        '_field_set': frozenset(fields),
+    })
+
+
+def make_record(fields, values):
+    return record_class(fields)(values)
+
@@ -1,9 +1,10 @@
 import dateparser
 from datetime import datetime
 import logging
-import requests
 
 from SearchAPI.asf_env import get_config
+from SearchAPI.asf_session import get_session
+from SearchAPI.asf_deadline import get_deadline
 
 
 def input_fixer(params):
@@ -153,7 +154,7 @@ def fix_polygon(v):
     logging.debug('Checking winding order')
     cfg = get_config()
 
-    r = requests.post(
+    r = get_session().post(
         cfg['cmr_base'] + cfg['cmr_api'],
         headers=cfg['cmr_headers'],
         data={
@@ -162,7 +163,8 @@ def fix_polygon(v):
             'page_size': 1,
             'concept-id': 'C1266376001-ASF',
             'attribute[]': 'string,ASF_PLATFORM,FAKEPLATFORM'
-        }
+        },
+        timeout=get_deadline().timeout()
     )
 
     if r.status_code == 200:
@@ -175,7 +177,7 @@ def fix_polygon(v):
             rev = reversed(list(zip(it, it)))
             rv = [i for sub in rev for i in sub]
 
-            r = requests.post(
+            r = get_session().post(
                     cfg['cmr_base'] + cfg['cmr_api'],
                     headers=cfg['cmr_headers'],
                     data={
@@ -184,7 +186,8 @@ def fix_polygon(v):
                         'page_size': 1,
                         'concept-id': 'C1266376001-ASF',
                         'attribute[]': 'string,ASF_PLATFORM,FAKEPLATFORM'
-                    }
+                    },
+                    timeout=get_deadline().timeout()
                 )
 
             if r.status_code == 200:
@@ -1,233 +1,405 @@
+import io
 import logging
-from defusedxml.lxml import fromstring
+import threading
+from functools import lru_cache
+from lxml import etree
+from defusedxml.common import DefusedXmlException
+from defusedxml.lxml import check_docinfo
 import datetime
-from .fields import get_field_paths, attr_path
+import sys
+from .fields import field_paths, attr_path, AttributePath
+from .granule_record import record_class
+from SearchAPI.CMR.Footprint import shape_from_gpolygon
+
+# Same protections defusedxml gives us, for a parser that can stream: no
+# entity expansion, no network access, no DTDs
+parser_options = {
+    'resolve_entities': False,
+    'no_network': True,
+    'load_dtd': False,
+    'huge_tree': False,
+}
 
 
 def parse_cmr_response(r, req_fields):
     """
     Convert echo10 xml to results list used by output translators
     """
+    return parse_cmr_content(r.content, req_fields)
+
+
+def parse_cmr_page(content, req_fields):
+    """
+    A whole page of results at once, for parsing in another process
+    """
+    return list(parse_cmr_content(content, req_fields))
+
+
+def parse_cmr_content(content, req_fields):
+    """
+    Granules are parsed one at a time as the parser reaches the end of each,
+    and thrown away once they've been converted, so a page never has to
+    exist as a whole document.
+    """
     logging.debug('parsing CMR results')
 
+    granules = etree.iterparse(
+        io.BytesIO(content), events=('end',), tag='Granule', **parser_options
+    )
+
+    plan = extraction_plan(tuple(req_fields))
+
+    num_results = 0
     try:
-        root = fromstring(r.text.encode('latin-1'))
-    except Exception as e:
-        logging.error(f'CMR parsing error: {e} when parsing: {r.text}')
+        for _, granule in granules:
+            if num_results == 0:
+                check_docinfo(granule.getroottree())
+
+            yield plan(granule)
+            num_results += 1
+
+            # Drop this granule, and the <result> wrappers of the ones before it
+            result = granule.getparent()
+            granule.clear()
+            while result.getprevious() is not None:
+                del result.getparent()[0]
+    except (etree.XMLSyntaxError, DefusedXmlException) as e:
+        logging.error(f'CMR parsing error: {e} when parsing: {content.decode(errors="replace")}')
         return
 
-    num_results = len(root.xpath('/results/result/Granule'))
     logging.debug(f'Found {num_results} results in this page')
 
-    for granule in root.xpath('/results/result/Granule'):
-        yield parse_granule(granule, req_fields)
 
+_compiled = threading.local()
 
-def parse_granule(granule, req_fields):
-    req_fields = req_fields.copy() # gotta copy this list because we're gonna thrash it
-    def get_val(path):
-        r = granule.xpath(path)
 
-        if r is not None and len(r) > 0:
-            return r[0].text
-        else:
-            return None
+def compiled_xpath(path):
+    """
+    XPath expressions are compiled once, rather than on every call to
+    .xpath(). Compiled ones shouldn't be shared between threads, so each
+    thread gets its own.
+    """
+    paths = getattr(_compiled, 'paths', None)
+    if paths is None:
+        paths = _compiled.paths = {}
 
-    def get_all_vals(path):
-        r = granule.xpath(path)
+    xpath = paths.get(path)
+    if xpath is None:
+        xpath = paths[path] = etree.XPath(path)
 
-        if r is not None and len(r) > 0:
-            return [v.text for v in r]
-        else:
-            return None
+    return xpath
 
-    def remove_field(f):
-        try:
-            req_fields.remove(f)
-        except ValueError:
-            pass
 
-    field_paths = get_field_paths()
-    result = {}
+def attribute_map(granule):
+    """
+    Every AdditionalAttribute's values by name, in one pass over the granule
+    """
+    attributes = {}
 
-    # Handle a few special cases
-    if any(field in req_fields for field in ['shape', 'stringFootprint']):
-        shape, wkt_shape = wkt_from_gpolygon(
-            granule.xpath('./Spatial/HorizontalSpatialDomain/Geometry/GPolygon')
+    for attribute in granule.iterfind('AdditionalAttributes/AdditionalAttribute'):
+        attributes.setdefault(attribute.findtext('Name'), []).extend(
+            v.text for v in attribute.iterfind('Values/Value')
         )
-        result['shape'] = shape
-        result['stringFootprint'] = wkt_shape
-        remove_field('shape')
-        remove_field('stringFootprint')
-
-    if any(field in req_fields for field in ['platform', 'frameNumber', 'canInsar']):
-        platform = get_val(attr_path('ASF_PLATFORM'))
-        if platform is None:
-            platform = get_val('./Platforms/Platform/ShortName')
-        result['platform'] = platform
-        remove_field('platform')
-
-    if 'frameNumber' in req_fields:
-        asf_frame_platforms = ['Sentinel-1A', 'Sentinel-1B', 'ALOS']
-        result['frameNumber'] = get_val(attr_path('FRAME_NUMBER')) \
-            if result['platform'] in asf_frame_platforms \
-            else get_val(attr_path('CENTER_ESA_FRAME'))
-        remove_field('frameNumber')
-
-    if 'browse' in req_fields:
-        result['browse'] = get_browse_urls(granule, './AssociatedBrowseImageUrls')
-        remove_field('browse')
-
-    if 'fileName' in req_fields:
-        result['fileName'] = get_val("./OnlineAccessURLs/OnlineAccessURL/URL").split('/')[-1]
-        remove_field('fileName')
-
-    if 'stateVectors' in req_fields or ('canInsar' in req_fields and result['platform'] not in ['ALOS', 'RADARSAT-1', 'JERS-1', 'ERS-1', 'ERS-2']):
-        def parse_sv(sv):
-            def float_or_none(a):
-                try:
-                    return float(a)
-                except ValueError:
-                    return None
-
-            if sv is None:
-                return (None, None)
-            (x, y, z, t) = sv.split(',')
-            v = [float_or_none(x), float_or_none(y), float_or_none(z)]
-            if None not in v:
-                return (v, t if datetime.datetime.strptime(t, '%Y-%m-%dT%H:%M:%S.%f') is not None else None)
-            else:
-                return (None, None)
-
-        result['sv_pos_pre'], result['sv_t_pos_pre'] = parse_sv(get_val(attr_path('SV_POSITION_PRE')))
-        result['sv_pos_post'], result['sv_t_pos_post'] = parse_sv(get_val(attr_path('SV_POSITION_POST')))
-        result['sv_vel_pre'], result['sv_t_vel_pre'] = parse_sv(get_val(attr_path('SV_VELOCITY_PRE')))
-        result['sv_vel_post'], result['sv_t_vel_post'] = parse_sv(get_val(attr_path('SV_VELOCITY_POST')))
-        result['baseline'] = {
-            'stateVectors': {
-                'positions': {
-                    'prePosition': result['sv_pos_pre'],
-                    'postPosition': result['sv_pos_post'],
-                    'prePositionTime': result['sv_t_pos_pre'],
-                    'postPositionTime': result['sv_t_pos_post']
-                },
-                'velocities': {
-                    'preVelocity': result['sv_vel_pre'],
-                    'postVelocity': result['sv_vel_post'],
-                    'preVelocityTime': result['sv_t_vel_pre'],
-                    'postVelocityTime': result['sv_t_vel_post']
-                },
-            },
-            'ascendingNodeTime': get_val(attr_path('ASC_NODE_TIME')),
-        }
-        remove_field('stateVectors')
-
-    if 'canInsar' in req_fields:
-        if result['platform'] in ['ALOS', 'RADARSAT-1', 'JERS-1', 'ERS-1', 'ERS-2']:
-            result['insarGrouping'] = get_val(field_paths['insarGrouping'])
-            
-            insarBaseline = get_val(field_paths['insarBaseline'])
-            if insarBaseline is not None:
-                insarBaseline = float(insarBaseline)
-            result['baseline'] = {
-                'insarBaseline': insarBaseline
-                } 
-            remove_field('insarGrouping')
-            if result['insarGrouping'] not in [None, 0, '0', 'NA', 'NULL']:
-                result['canInsar'] = True
-            else:
-                result['canInsar'] = False
-        elif None not in [
-            result['sv_pos_pre'], result['sv_pos_post'],
-            result['sv_vel_pre'], result['sv_vel_post'],
-            result['sv_t_pos_pre'], result['sv_t_pos_post'],
-            result['sv_t_vel_pre'], result['sv_t_vel_post']]:
-            result['canInsar'] = True
+
+    return attributes
+
+
+class GranuleReader:
+    """
+    Field lookups on a single granule. AdditionalAttributes are read into a
+    map the first time one is asked for, rather than searched for each time.
+    """
+    __slots__ = ['granule', 'attributes']
+
+    def __init__(self, granule):
+        self.granule = granule
+        self.attributes = None
+
+    def get_all_vals(self, path):
+        if isinstance(path, AttributePath):
+            if self.attributes is None:
+                self.attributes = attribute_map(self.granule)
+            r = self.attributes.get(path.name)
         else:
-            result['canInsar'] = False
-        remove_field('canInsar')
-
-    # These fields are always None or NA and should be fully deprecated/removed in the future
-    deprecated_fields = [
-        'beamSwath',
-        'catSceneId',
-        'formatName',
-        'frequency',
-        'incidenceAngle',
-        'masterGranule',
-        'percentCoherence',
-        'percentTroposphere',
-        'percentUnwrapped',
-        'sarSceneId',
-        'sceneDateString',
-        'slaveGranule',
-        'status',
-        'varianceTroposphere'
-    ]
-    for f in deprecated_fields:
-        if f in req_fields:
-            result[f] = None
-            try:
-                req_fields.remove(f)
-            except ValueError:
-                pass
-
-    # Parse any remaining needed fields from the CMR response
-    multi_fields = [
-        'absoluteOrbit',
-        'baseline'
-    ]
-    for field in req_fields:
-        if field in multi_fields:
-            result[field] = get_all_vals(field_paths[field])
+            r = [v.text for v in compiled_xpath(path)(self.granule)]
+
+        if r is not None and len(r) > 0:
+            return r
         else:
-            result[field] = get_val(field_paths[field])
+            return None
+
+    def get_val(self, path):
+        r = self.get_all_vals(path)
+
+        return r[0] if r is not None else None
 
-    for k in result:
-        if result[k] in ['NULL', 'NA', 'None']:
-            result[k] = None
 
-    return result
+def parse_granule(granule, req_fields):
+    return extraction_plan(tuple(req_fields))(granule)
 
 
-def wkt_from_gpolygon(gpoly):
+@lru_cache(maxsize=None)
+def extraction_plan(req_fields):
+    """
+    One plan per distinct set of fields, so once per output format (plus
+    whatever fields the query adds) for the life of the process
+    """
+    return ExtractionPlan(req_fields)
+
+
+# Platforms whose InSAR stacks are precalculated, rather than worked out
+# from state vectors
+precalc_platforms = ['ALOS', 'RADARSAT-1', 'JERS-1', 'ERS-1', 'ERS-2']
+
+# These fields are always None or NA and should be fully deprecated/removed in the future
+deprecated_fields = [
+    'beamSwath',
+    'catSceneId',
+    'formatName',
+    'frequency',
+    'incidenceAngle',
+    'masterGranule',
+    'percentCoherence',
+    'percentTroposphere',
+    'percentUnwrapped',
+    'sarSceneId',
+    'sceneDateString',
+    'slaveGranule',
+    'status',
+    'varianceTroposphere'
+]
+
+multi_fields = [
+    'absoluteOrbit',
+    'baseline'
+]
+
+# Fields with a handful of possible values, repeated on every result. These
+# are interned so all the records share one copy of each value.
+enumerated_fields = [
+    'beamMode',
+    'beamModeType',
+    'collectionName',
+    'configurationName',
+    'flightDirection',
+    'granuleType',
+    'lookDirection',
+    'missionName',
+    'platform',
+    'polarization',
+    'processingLevel',
+    'processingType',
+    'processingTypeDisplay',
+    'sensor',
+]
+
+
+class ExtractionPlan:
     """
-    for kml generation
+    Works out once, for a list of fields, which special cases apply and in
+    what order, so parsing a granule is just running the steps: no copying
+    and thrashing the field list for every granule
     """
-    shapes = []
-    for g in gpoly:
-        shapes.append([])
-        for point in g.iter('Point'):
-            shapes[-1].append({
-                'lon': point.findtext('PointLongitude'),
-                'lat': point.findtext('PointLatitude')
-            })
+    def __init__(self, req_fields):
+        fields = set(req_fields)
+        handled = set(deprecated_fields)
+        self.steps = []
+
+        # Handle a few special cases
+        if fields & {'shape', 'stringFootprint'}:
+            self.steps.append(extract_shape)
+            handled |= {'shape', 'stringFootprint'}
+
+        if fields & {'platform', 'frameNumber', 'canInsar'}:
+            self.steps.append(extract_platform)
+            handled.add('platform')
+
+        for field, step in [
+            ('frameNumber', extract_frame_number),
+            ('browse', extract_browse),
+            ('fileName', extract_file_name),
+            ('stateVectors', extract_state_vectors),
+        ]:
+            if field in fields:
+                self.steps.append(step)
+                handled.add(field)
+
+        if 'canInsar' in fields:
+            # Without the state vectors themselves, just check they're usable
+            self.steps.append(
+                extract_can_insar if 'stateVectors' in fields else check_can_insar
+            )
+            handled.add('canInsar')
+
+        self.deprecated = [f for f in deprecated_fields if f in fields]
+
+        # Parse any remaining needed fields from the CMR response
+        self.fields = [
+            (field, field_paths[field], field in multi_fields, field in enumerated_fields)
+            for field in dict.fromkeys(req_fields) if field not in handled
+        ]
+
+        # A slot for every key the steps and fields can fill in
+        keys = [k for step in self.steps for k in step_keys[step]]
+        keys += self.deprecated + [field for field, *_ in self.fields]
+        self.record_class = record_class(tuple(dict.fromkeys(keys)))
+
+    def __call__(self, granule):
+        reader = GranuleReader(granule)
+        result = {}
+
+        for step in self.steps:
+            step(reader, result)
+
+        for field in self.deprecated:
+            result[field] = None
+
+        for field, path, multi, enumerated in self.fields:
+            if multi:
+                result[field] = reader.get_all_vals(path)
+            else:
+                value = reader.get_val(path)
+                result[field] = sys.intern(value) if enumerated and value is not None else value
+
+        for k in result:
+            if isinstance(result[k], str) and result[k] in ['NULL', 'NA', 'None']:
+                result[k] = None
 
-        if shape_not_closed(shapes):
-            # Close the shape if needed
-            shapes[-1].append(shapes[-1][0])
+        return self.record_class(result)
 
-    longest = shapes[0]
-    for shape in shapes:
-        if len(shape) > len(longest):
-            longest = shape
 
-    wkt_shape = 'POLYGON(({0}))'.format(
-        ','.join(['{0} {1}'.format(x['lon'], x['lat']) for x in longest])
+def extract_shape(reader, result):
+    shape, wkt_shape = shape_from_gpolygon(
+        compiled_xpath('./Spatial/HorizontalSpatialDomain/Geometry/GPolygon')(reader.granule)
     )
+    result['shape'] = shape
+    result['stringFootprint'] = wkt_shape
 
-    return longest, wkt_shape
 
+def extract_platform(reader, result):
+    platform = reader.get_val(attr_path('ASF_PLATFORM'))
+    if platform is None:
+        platform = reader.get_val('./Platforms/Platform/ShortName')
+    result['platform'] = sys.intern(platform) if platform is not None else None
 
-def shape_not_closed(shapes):
-    return (
-        shapes[-1][0]['lat'] != shapes[-1][-1]['lat'] or
-        shapes[-1][0]['lon'] != shapes[-1][-1]['lon']
-    )
+
+def extract_frame_number(reader, result):
+    asf_frame_platforms = ['Sentinel-1A', 'Sentinel-1B', 'ALOS']
+    result['frameNumber'] = reader.get_val(attr_path('FRAME_NUMBER')) \
+        if result['platform'] in asf_frame_platforms \
+        else reader.get_val(attr_path('CENTER_ESA_FRAME'))
+
+
+def extract_browse(reader, result):
+    result['browse'] = get_browse_urls(reader.granule, './AssociatedBrowseImageUrls')
+
+
+def extract_file_name(reader, result):
+    result['fileName'] = reader.get_val("./OnlineAccessURLs/OnlineAccessURL/URL").split('/')[-1]
+
+
+def parse_sv(sv):
+    def float_or_none(a):
+        try:
+            return float(a)
+        except ValueError:
+            return None
+
+    if sv is None:
+        return (None, None)
+    (x, y, z, t) = sv.split(',')
+    v = [float_or_none(x), float_or_none(y), float_or_none(z)]
+    if None not in v:
+        return (v, t if datetime.datetime.strptime(t, '%Y-%m-%dT%H:%M:%S.%f') is not None else None)
+    else:
+        return (None, None)
+
+
+state_vector_attributes = [
+    'SV_POSITION_PRE',
+    'SV_POSITION_POST',
+    'SV_VELOCITY_PRE',
+    'SV_VELOCITY_POST'
+]
+
+
+def extract_state_vectors(reader, result):
+    result['sv_pos_pre'], result['sv_t_pos_pre'] = parse_sv(reader.get_val(attr_path('SV_POSITION_PRE')))
+    result['sv_pos_post'], result['sv_t_pos_post'] = parse_sv(reader.get_val(attr_path('SV_POSITION_POST')))
+    result['sv_vel_pre'], result['sv_t_vel_pre'] = parse_sv(reader.get_val(attr_path('SV_VELOCITY_PRE')))
+    result['sv_vel_post'], result['sv_t_vel_post'] = parse_sv(reader.get_val(attr_path('SV_VELOCITY_POST')))
+    # Keys in sorted order, that's how they're written out
+    result['baseline'] = {
+        'ascendingNodeTime': reader.get_val(attr_path('ASC_NODE_TIME')),
+        'stateVectors': {
+            'positions': {
+                'postPosition': result['sv_pos_post'],
+                'postPositionTime': result['sv_t_pos_post'],
+                'prePosition': result['sv_pos_pre'],
+                'prePositionTime': result['sv_t_pos_pre']
+            },
+            'velocities': {
+                'postVelocity': result['sv_vel_post'],
+                'postVelocityTime': result['sv_t_vel_post'],
+                'preVelocity': result['sv_vel_pre'],
+                'preVelocityTime': result['sv_t_vel_pre']
+            },
+        },
+    }
+
+
+def extract_precalc_insar(reader, result):
+    result['insarGrouping'] = reader.get_val(field_paths['insarGrouping'])
+
+    insarBaseline = reader.get_val(field_paths['insarBaseline'])
+    if insarBaseline is not None:
+        insarBaseline = float(insarBaseline)
+    result['baseline'] = {
+        'insarBaseline': insarBaseline
+        }
+    result['canInsar'] = result['insarGrouping'] not in [None, 0, '0', 'NA', 'NULL']
+
+
+def extract_can_insar(reader, result):
+    if result['platform'] in precalc_platforms:
+        extract_precalc_insar(reader, result)
+    else:
+        result['canInsar'] = None not in [
+            result['sv_pos_pre'], result['sv_pos_post'],
+            result['sv_vel_pre'], result['sv_vel_post'],
+            result['sv_t_pos_pre'], result['sv_t_pos_post'],
+            result['sv_t_vel_pre'], result['sv_t_vel_post']]
+
+
+def check_can_insar(reader, result):
+    if result['platform'] in precalc_platforms:
+        extract_precalc_insar(reader, result)
+    else:
+        result['canInsar'] = all(
+            None not in parse_sv(reader.get_val(attr_path(name)))
+            for name in state_vector_attributes
+        )
+
+
+# Keys each step can add to a result
+step_keys = {
+    extract_shape: ['shape', 'stringFootprint'],
+    extract_platform: ['platform'],
+    extract_frame_number: ['frameNumber'],
+    extract_browse: ['browse'],
+    extract_file_name: ['fileName'],
+    extract_state_vectors: [
+        'sv_pos_pre', 'sv_t_pos_pre', 'sv_pos_post', 'sv_t_pos_post',
+        'sv_vel_pre', 'sv_t_vel_pre', 'sv_vel_post', 'sv_t_vel_post',
+        'baseline',
+    ],
+    extract_can_insar: ['canInsar', 'insarGrouping', 'baseline'],
+    check_can_insar: ['canInsar', 'insarGrouping', 'baseline'],
+}
 
 
 def get_browse_urls(granule, browse_path):
-    browse_elems = granule.xpath(browse_path)
+    browse_elems = compiled_xpath(browse_path)(granule)
     browseList = []
 
     for b in browse_elems:
@@ -3,8 +3,9 @@ from .input_map import input_map
 
 from SearchAPI.CMR.Output import output_translators
 import json
-import requests
 from SearchAPI.asf_env import get_config
+from SearchAPI.asf_session import get_session
+from SearchAPI.asf_deadline import get_deadline
 
 def translate_params(p):
     """
@@ -18,13 +19,12 @@ def translate_params(p):
         if key not in input_map():
             raise ValueError(f'Unsupported parameter: {key}')
         if key == 'intersectswith': # Gotta catch this suuuuper early
-            s = requests.Session()
             repair_params = dict({'wkt': val})
             try:
                 repair_params['maturity'] = request.temp_maturity
             except AttributeError:
                 pass
-            response = json.loads(s.post(get_config()['this_api'] + '/services/utils/wkt', data=repair_params).text)
+            response = json.loads(get_session().post(get_config()['this_api'] + '/services/utils/wkt', data=repair_params, timeout=get_deadline().timeout()).text)
             if 'errors' in response:
                 raise ValueError(f'Could not repair WKT: {val}')
             val = response['wkt']['wrapped']
@@ -1,14 +1,15 @@
 from SearchAPI.asf_env import get_config
+from SearchAPI.asf_session import get_session
+from SearchAPI.asf_deadline import get_deadline
 from defusedxml.lxml import fromstring
 
 import logging
-import requests
 
 
 def getMissions(data):
     cfg = get_config()
 
-    r = requests.post(cfg['cmr_base'] + cfg['cmr_collections'], headers=cfg['cmr_headers'], data=data)
+    r = get_session().post(cfg['cmr_base'] + cfg['cmr_collections'], headers=cfg['cmr_headers'], data=data, timeout=get_deadline().timeout())
     if r.status_code != 200:
         return { 'errors': [{'type': 'CMR_ERROR', 'report': f'CMR Error: {r.text}'}]}
 
@@ -7,8 +7,13 @@ from flask import Response, make_response, stream_with_context
 import SearchAPI.api_headers as api_headers
 from SearchAPI.CMR.Query import CMRQuery
 from SearchAPI.CMR.Translate import translate_params, input_fixer
-from SearchAPI.CMR.Output import output_translators
-from SearchAPI.CMR.Exceptions import CMRError
+from SearchAPI.CMR.Output import output_translators, coalesce_chunks
+from SearchAPI.CMR.Exceptions import CMRError, CMRUnavailableError, CursorUnavailableError
+from SearchAPI.CMR.CircuitBreaker import cmr_breaker
+from SearchAPI.CMR.Cursor import encode_cursor, decode_cursor, require_secret
+from SearchAPI.CMR.Input import parse_int
+from SearchAPI.asf_env import get_config
+from SearchAPI.asf_deadline import DeadlineExceeded
 from SearchAPI.Analytics import analytics_events
 
 
@@ -17,18 +22,26 @@ class APISearchQuery:
     def __init__(self, request, should_stream=True):
         self.request = request
         self.cmr_params = {}
+        self.search_params = {}
         self.output = 'metalink'
         self.max_results = None
+        self.page_size = None
+        self.cursor = None
         self.should_stream = should_stream
 
     def get_response(self):
-
-        validated = self.can_use_cmr()
-        if validated is not True:
-            return self.validation_error(validated)
-
         try:
+            validated = self.can_use_cmr()
+            if validated is not True:
+                return self.validation_error(validated)
+
             return self.cmr_query()
+        except DeadlineExceeded as e:
+            return self.deadline_exceeded(e)
+        except CMRUnavailableError as e:
+            return self.cmr_unavailable(e)
+        except CursorUnavailableError as e:
+            return self.cursor_unavailable(e)
         except CMRError as e:
             return self.cmr_error(e)
 
@@ -52,9 +65,9 @@ class APISearchQuery:
         return True
 
     def check_has_search_params(self):
-        non_searchable_param = ['output', 'maxresults', 'pagesize', 'maturity']
+        non_searchable_param = ['output', 'maxresults', 'pagesize', 'cursor', 'maturity']
         searchables = [
-            v for v in self.request.local_values if v not in non_searchable_param
+            v for v in self.request.local_values if v.lower() not in non_searchable_param
         ]
 
         if len(searchables) <= 0:
@@ -83,17 +96,52 @@ class APISearchQuery:
             )
 
     def check_and_set_cmr_params(self):
+        paging_params = ['pagesize', 'cursor']
+        params = {
+            k: v for k, v in self.request.local_values.items()
+            if k.lower() not in paging_params
+        }
+        paging = {
+            k.lower(): v for k, v in self.request.local_values.items()
+            if k.lower() in paging_params
+        }
+        page_size, cursor = paging.get('pagesize'), paging.get('cursor')
+        self.search_params = params
+
         self.cmr_params, self.output, self.max_results = \
-            translate_params(self.request.local_values)
+            translate_params(params)
 
         self.cmr_params = input_fixer(self.cmr_params)
 
+        if page_size is not None or cursor is not None:
+            self.check_and_set_paging(page_size, cursor)
+
+    def check_and_set_paging(self, page_size, cursor):
+        if page_size is None:
+            raise ValueError('cursor must be used with pagesize')
+
+        if self.max_results is not None:
+            raise ValueError('pagesize may not be used in conjunction with maxresults')
+
+        # Every page but the last hands out a cursor, fail before searching
+        require_secret()
+
+        self.page_size = parse_int(page_size)
+        max_page_size = get_config()['cmr_max_page_size']
+        if not 0 < self.page_size <= max_page_size:
+            raise ValueError(f'Invalid pagesize, must be between 1 and {max_page_size}: {self.page_size}')
+
+        if cursor is not None:
+            self.cursor, resolved = decode_cursor(cursor, self.search_params)
+            self.cmr_params.update(resolved)
+
     def cmr_query(self):
         logging.debug(f'Handle query from {self.request.access_route[-1]}')
-        maxResults = self.max_results
 
-        if is_max_results_with_json_output(maxResults, self.output):
-            maxResults += 1
+        # Once the response starts streaming it's too late for a proper
+        # error status, so fail up front if CMR is known to be down
+        if cmr_breaker(get_config()).is_open():
+            raise CMRUnavailableError('CMR is not responding reliably right now, please try again later')
 
         translators = output_translators()
         translator, mimetype, suffix, req_fields = translators.get(self.output, translators['metalink'])
@@ -101,20 +149,66 @@ class APISearchQuery:
         query = CMRQuery(
             req_fields,
             params=dict(self.cmr_params),
-            max_results=maxResults
+            max_results=self.max_results,
+            # Cursors only track positions in CMR results
+            cache_lookups=self.page_size is None
         )
 
         if self.output == 'count':
             return make_response(f'{query.get_count()}\n')
 
+        if self.page_size is not None:
+            return self.cursor_page(query, translator, mimetype, suffix)
+
         filename = make_filename(suffix)
         d = api_headers.base(mimetype)
         d.add('Content-Disposition', 'attachment', filename=filename)
 
+        # By the time the output needs to know, the results have run out and
+        # the query knows whether they were cut short
+        chunks = self.mark_truncated(translator(query.get_results, truncated=lambda: query.truncated), query)
+
         if self.should_stream:
-            resp = stream_with_context(translator(query.get_results))
+            cfg = get_config()
+            resp = stream_with_context(coalesce_chunks(
+                chunks,
+                chunk_bytes=cfg['output_chunk_bytes'],
+                flush_seconds=cfg['output_flush_seconds'],
+                results=lambda: query.result_counter
+            ))
         else:
-            resp = ''.join(translator(query.get_results))
+            resp = ''.join(chunks)
+            if query.truncated:
+                d.add('ASF-Truncated', 'true')
+
+        return Response(resp, headers=d, mimetype=mimetype)
+
+    def mark_truncated(self, chunks, query):
+        """
+        If the query ran out of time, say so at the end of the output, in
+        formats that take a comment there. The JSON formats say so in the
+        document itself. Unstreamed responses also get the ASF-Truncated
+        header, which is all csv gets unless the headers have already gone.
+        """
+        yield from chunks
+
+        if query.truncated:
+            yield truncation_marker(self.output, streamed=self.should_stream)
+
+    def cursor_page(self, query, translator, mimetype, suffix):
+        """
+        A single page of results, with the cursor for the next one (if any)
+        in the ASF-Next-Cursor header. The page has to be fetched before the
+        headers go out, so it isn't streamed.
+        """
+        results, next_position = query.get_page(self.page_size, self.cursor)
+
+        d = api_headers.base(mimetype)
+        d.add('Content-Disposition', 'attachment', filename=make_filename(suffix))
+        if next_position is not None:
+            d.add('ASF-Next-Cursor', encode_cursor(self.search_params, self.cmr_params, next_position))
+
+        resp = ''.join(translator(lambda: iter(results)))
 
         return Response(resp, headers=d, mimetype=mimetype)
 
@@ -137,19 +231,66 @@ class APISearchQuery:
     def cmr_error(self, e):
         return make_response(f'A CMR error has occured: {e}')
 
+    def deadline_exceeded(self, e):
+        logging.warning(f'Request ran out of time, returning HTTP 504: {e}')
+
+        mimetype='application/json'
+        d = api_headers.base(mimetype=mimetype)
+
+        resp = json.dumps({
+            'error': {
+                'type': 'DEADLINE_EXCEEDED',
+                'report': f'Deadline Exceeded: {e}'
+            }
+        }, sort_keys=True, indent=4)
+
+        return Response(resp, 504, headers=d, mimetype=mimetype)
+
+    def cmr_unavailable(self, e):
+        logging.warning(f'CMR unavailable, returning HTTP 503: {e}')
+
+        mimetype='application/json'
+        d = api_headers.base(mimetype=mimetype)
+        d.add('Retry-After', str(get_config()['cmr_breaker_open_seconds']))
+
+        resp = json.dumps({
+            'error': {
+                'type': 'CMR_UNAVAILABLE',
+                'report': f'CMR Unavailable: {e}'
+            }
+        }, sort_keys=True, indent=4)
+
+        return Response(resp, 503, headers=d, mimetype=mimetype)
+
+    def cursor_unavailable(self, e):
+        logging.error(f'Paged search without a cursor signing key, returning HTTP 500: {e}')
+
+        mimetype='application/json'
+        d = api_headers.base(mimetype=mimetype)
+
+        resp = json.dumps({
+            'error': {
+                'type': 'CURSOR_UNAVAILABLE',
+                'report': f'Cursor Unavailable: {e}'
+            }
+        }, sort_keys=True, indent=4)
+
+        return Response(resp, 500, headers=d, mimetype=mimetype)
+
+
+def truncation_marker(output, streamed):
+    message = 'Results truncated: the request ran out of time before all results were returned'
 
-def is_max_results_with_json_output(maxResults, output):
-    '''
-    This is absolutely the darndest thing. Something about streaming json AND having maxresults
-    set leads to truncating the last result. If maxresults is not set, no truncation happens.
-    This only affects json-based formats, all others work fine with or without maxresults.
-    This is an admittedly kludgey workaround but I just can't seem to pinpoint the issue yet.
-    '''
+    if output in ['kml', 'metalink']:
+        return f'\n<!-- {message} -->\n'
+    if output == 'download':
+        return f'\n# {message}\n'
+    if output == 'csv' and streamed:
+        # csv has no comments of its own, but most readers can skip lines
+        # starting with # (e.g. pandas' comment='#')
+        return f'# {message}\n'
 
-    return (
-        maxResults is not None and
-        output.lower() in ['json', 'jsonlite', 'geojson', 'jsonlite2', 'asf_search']
-    )
+    return ''
 
 
 def make_filename(suffix):
@@ -12,10 +12,12 @@ import logging
 import os
 import json
 from SearchAPI.CMR.Health import get_cmr_health
+from SearchAPI.CMR.Cache import cache_stats
 from SearchAPI.CMR.Output import output_translators
 from SearchAPI.Analytics import analytics_pageview
 from werkzeug.exceptions import RequestEntityTooLarge
 from SearchAPI.asf_env import get_config, load_config
+from SearchAPI.asf_deadline import start_deadline
 from time import perf_counter
 import boto3
 
@@ -24,7 +26,7 @@ import SearchAPI.endpoints as endpoints
 application = Flask(__name__)
 # ALSO update upload size in .ebextentions/04_enable_streaming.config:
 application.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024 # limit to 10 MB, primarily affects file uploads
-CORS(application, send_wildcard=True)
+CORS(application, send_wildcard=True, expose_headers=['ASF-Next-Cursor', 'ASF-Truncated'])
 talisman = Talisman(application)
 
 # So this isn't repeated with each call to the lambda hook:
@@ -106,7 +108,7 @@ def health_check():
         logging.debug(e)
         api_version = {'version': 'unknown'}
     cmr_health = get_cmr_health()
-    api_health = {'ASFSearchAPI': {'ok?': True, 'version': api_version['version'], 'config': request.asf_config}, 'CMRSearchAPI': cmr_health}
+    api_health = {'ASFSearchAPI': {'ok?': True, 'version': api_version['version'], 'config': request.asf_config, 'caches': cache_stats()}, 'CMRSearchAPI': cmr_health}
     response = make_response(json.dumps(api_health, sort_keys=True, indent=2))
     response.mimetype = 'application/json; charset=utf-8'
     return response
@@ -122,6 +124,7 @@ def handle_oversize_request(error):
 @application.before_request
 def preflight():
     load_config()
+    start_deadline()
     analytics_pageview()
     logging.debug('Using config:')
     logging.debug(get_config())
@@ -136,20 +139,33 @@ def postflight(e):
         if request.asf_config['cloudwatch_metrics']:
             logging.debug('Logging query run time to cloudwatch metrics')
             cloudwatch = boto3.client('cloudwatch')
+            metrics = [
+                {
+                    'MetricName': 'TotalQueryRunTime',
+                    'Dimensions': [
+                        {
+                            'Name': 'maturity',
+                            'Value': request.asf_base_maturity
+                        }
+                    ],
+                    'Unit': 'None',
+                    'Value': query_run_time
+                }
+            ]
+            if hasattr(request, 'cmr_subqueries_eliminated'):
+                metrics.append({
+                    'MetricName': 'SubqueriesEliminated',
+                    'Dimensions': [
+                        {
+                            'Name': 'maturity',
+                            'Value': request.asf_base_maturity
+                        }
+                    ],
+                    'Unit': 'Count',
+                    'Value': request.cmr_subqueries_eliminated
+                })
             response = cloudwatch.put_metric_data(
-                MetricData = [
-                    {
-                        'MetricName': 'TotalQueryRunTime',
-                        'Dimensions': [
-                            {
-                                'Name': 'maturity',
-                                'Value': request.asf_base_maturity
-                            }
-                        ],
-                        'Unit': 'None',
-                        'Value': query_run_time
-                    }
-                ],
+                MetricData = metrics,
                 Namespace = 'SearchAPI'
             )
     except Exception as e:
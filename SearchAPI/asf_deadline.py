@@ -0,0 +1,60 @@
+import logging
+from time import monotonic
+
+from flask import request
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """
+    How long this request has left to run. Every outbound call takes its
+    timeout from here, so a hung socket can't hold the request (and the
+    worker serving it) past the time it was given.
+    """
+    def __init__(self, seconds, connect_timeout):
+        self.seconds = seconds
+        self.connect_timeout = connect_timeout
+        self.expires_at = monotonic() + seconds
+
+    def remaining(self):
+        return max(0, self.expires_at - monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self):
+        """
+        (connect, read) timeouts for the next call, same as requests takes
+        """
+        remaining = self.remaining()
+
+        if remaining <= 0:
+            raise DeadlineExceeded(f'Request ran past its {self.seconds} second deadline')
+
+        return min(self.connect_timeout, remaining), remaining
+
+
+def start_deadline():
+    """
+    Clients can ask for a shorter deadline than the configured one with the
+    ASF-Request-Timeout header (seconds), never a longer one
+    """
+    cfg = request.asf_config
+    seconds = cfg['request_timeout']
+
+    requested = request.headers.get('ASF-Request-Timeout')
+    if requested is not None:
+        try:
+            if float(requested) > 0:
+                seconds = min(seconds, float(requested))
+        except ValueError:
+            logging.warning(f'Ignoring invalid ASF-Request-Timeout: {requested}')
+
+    request.asf_deadline = Deadline(seconds, cfg['http_connect_timeout'])
+
+
+def get_deadline():
+    return request.asf_deadline
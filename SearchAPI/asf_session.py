@@ -0,0 +1,66 @@
+import logging
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from SearchAPI.asf_env import load_config_file
+
+# Lives for the life of the process, so connections stay warm between
+# requests (and between invocations of a warm lambda)
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Shared requests.Session for every outbound call. Safe to share between
+    threads as long as nobody mutates it: pass per-call headers to the
+    request instead of updating session.headers.
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+
+    return _session
+
+
+def build_session():
+    size = pool_size()
+    logging.debug(f'New shared requests.Session, {size} connections per host')
+
+    session = requests.Session()
+
+    # Never carry cookies from one user's query into another's
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def pool_size():
+    """
+    Room for as many requests to CMR as the limiter lets through at once
+    (cmr_global_concurrency), a hedge for each if hedging is on (see the
+    hedge executor), and one per gunicorn thread (one per core, see
+    Dockerfile) for calls made outside the limiter. Anything past the pool
+    gets a connection that's thrown away after one use. The session outlives
+    any one request, so this is the process maturity's config (a flexible
+    maturity only swaps URLs). Override with HTTP_POOL_SIZE.
+    """
+    if 'HTTP_POOL_SIZE' in os.environ:
+        return int(os.environ['HTTP_POOL_SIZE'])
+
+    cfg = load_config_file()[os.environ.get('MATURITY', 'local')]
+    limited = cfg['cmr_global_concurrency']
+    hedges = limited if cfg['cmr_hedge_percentile'] > 0 else 0
+
+    return limited + hedges + (os.cpu_count() or 1)
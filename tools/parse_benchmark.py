@@ -0,0 +1,125 @@
+#!/usr/bin/python
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SearchAPI.CMR.Translate.parse_cmr_response import parse_cmr_page
+from SearchAPI.CMR.Output import output_translators
+
+# Roughly what a Sentinel-1 SLC looks like coming back from CMR
+attributes = {
+    'ASF_PLATFORM': 'Sentinel-1A', 'BEAM_MODE': 'IW', 'BEAM_MODE_TYPE': 'IW',
+    'BEAM_MODE_DESC': 'Interferometric Wide', 'POLARIZATION': 'VV+VH',
+    'PROCESSING_TYPE': 'SLC', 'PROCESSING_TYPE_DISPLAY': 'L1 Single Look Complex (SLC)',
+    'PROCESSING_LEVEL': 'L1', 'PATH_NUMBER': '64', 'FRAME_NUMBER': '200',
+    'CENTER_ESA_FRAME': '1234', 'BYTES': '4300000000', 'MD5SUM': '1234567890abcdef1234567890abcdef',
+    'GROUP_ID': 'S1A_IWDV_0200_0206_012345_064', 'ASCENDING_DESCENDING': 'ASCENDING',
+    'LOOK_DIRECTION': 'R', 'OFF_NADIR_ANGLE': '-1', 'FARADAY_ROTATION': 'NA',
+    'CENTER_LAT': '64.1', 'CENTER_LON': '-147.5', 'NEAR_START_LAT': '63.2', 'NEAR_START_LON': '-149.1',
+    'FAR_START_LAT': '63.6', 'FAR_START_LON': '-145.9', 'NEAR_END_LAT': '64.7', 'NEAR_END_LON': '-149.2',
+    'FAR_END_LAT': '65.1', 'FAR_END_LON': '-145.8', 'DOPPLER': '0', 'INSAR_STACK_ID': 'NA',
+    'SV_POSITION_PRE': '-1234567.1,2345678.2,6543210.3,2020-01-01T00:00:00.000000',
+    'SV_POSITION_POST': '-1234567.1,2345678.2,6543210.3,2020-01-01T00:00:10.000000',
+    'SV_VELOCITY_PRE': '1234.5,-2345.6,6543.2,2020-01-01T00:00:00.000000',
+    'SV_VELOCITY_POST': '1234.5,-2345.6,6543.2,2020-01-01T00:00:10.000000',
+    'ASC_NODE_TIME': '2019-12-31T23:50:00.000000', 'MISSION_NAME': 'NA',
+    'THUMBNAIL_URL': 'https://datapool.asf.alaska.edu/THUMBNAIL/SA/granule_thumb.jpg',
+}
+
+
+def synthetic_page(granules):
+    attribute_xml = ''.join(
+        f'<AdditionalAttribute><Name>{k}</Name><Values><Value>{v}</Value></Values></AdditionalAttribute>'
+        for k, v in attributes.items()
+    )
+    points = ''.join(
+        f'<Point><PointLongitude>{lon}</PointLongitude><PointLatitude>{lat}</PointLatitude></Point>'
+        for lon, lat in [(-149.1, 63.2), (-145.9, 63.6), (-145.8, 65.1), (-149.2, 64.7)]
+    )
+
+    results = []
+    for i in range(granules):
+        name = f'S1A_IW_SLC__1SDV_20200101T000000_20200101T000027_030000_036000_{i:04X}'
+        results.append(
+            f'<result><Granule><GranuleUR>{name}-SLC</GranuleUR>'
+            f'<DataGranule><ProducerGranuleId>{name}</ProducerGranuleId>'
+            f'<ProductionDateTime>2020-01-01T01:00:00Z</ProductionDateTime>'
+            f'<SizeMBDataGranule>4100.5</SizeMBDataGranule></DataGranule>'
+            f'<Temporal><RangeDateTime><BeginningDateTime>2020-01-01T00:00:00.000000Z</BeginningDateTime>'
+            f'<EndingDateTime>2020-01-01T00:00:27.000000Z</EndingDateTime></RangeDateTime></Temporal>'
+            f'<Spatial><HorizontalSpatialDomain><Geometry><GPolygon><Boundary>{points}</Boundary>'
+            f'</GPolygon></Geometry></HorizontalSpatialDomain></Spatial>'
+            f'<OrbitCalculatedSpatialDomains><OrbitCalculatedSpatialDomain><OrbitNumber>30000</OrbitNumber>'
+            f'</OrbitCalculatedSpatialDomain></OrbitCalculatedSpatialDomains>'
+            f'<Platforms><Platform><ShortName>SENTINEL-1A</ShortName><Instruments><Instrument>'
+            f'<ShortName>C-SAR</ShortName></Instrument></Instruments></Platform></Platforms>'
+            f'<AdditionalAttributes>{attribute_xml}</AdditionalAttributes>'
+            f'<OnlineAccessURLs><OnlineAccessURL><URL>https://datapool.asf.alaska.edu/SLC/SA/{name}.zip</URL>'
+            f'</OnlineAccessURL></OnlineAccessURLs></Granule></result>'
+        )
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<results><hits>{granules}</hits><took>10</took>{"".join(results)}</results>'
+    ).encode()
+
+
+def run_serial(pages, req_fields):
+    return sum(len(parse_cmr_page(page, req_fields)) for page in pages)
+
+
+def run_pool(pool, pages, req_fields):
+    # map() hands results back in page order, same as the service does
+    return sum(len(records) for records in pool.map(parse_cmr_page, pages, repeat(req_fields)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure CMR page parsing throughput, in this process and in pools of worker processes.')
+    parser.add_argument('-o', '--output', action='store', default='json', help='Output format whose fields to parse (default json)')
+    parser.add_argument('-p', '--pages', action='store', type=int, default=40, help='Number of pages to parse (default 40)')
+    parser.add_argument('-g', '--granules', action='store', type=int, default=2000, help='Granules per synthetic page (default 2000)')
+    parser.add_argument('-f', '--file', action='store', help='Use a saved CMR echo10 response as the page instead of a synthetic one')
+    parser.add_argument('-w', '--workers', action='store', type=int, nargs='+', help='Pool sizes to try (default 1, 2, 4... up to the number of CPUs)')
+
+    args = parser.parse_args()
+
+    if args.file is not None:
+        with open(args.file, 'rb') as page_file:
+            page = page_file.read()
+    else:
+        page = synthetic_page(args.granules)
+
+    pages = [page] * args.pages
+    req_fields = tuple(output_translators()[args.output][3])
+
+    workers = args.workers
+    if workers is None:
+        workers, n = [], 1
+        while n <= os.cpu_count():
+            workers.append(n)
+            n *= 2
+
+    start = time.perf_counter()
+    granules = run_serial(pages, req_fields)
+    serial = time.perf_counter() - start
+    print(f'{granules} granules, {len(pages)} pages of {len(page)} bytes, {args.output} fields')
+    print('"Workers","Seconds","Granules/s","Speedup"')
+    print(f'"in process","{serial:.2f}","{granules / serial:.0f}","1.00"')
+
+    for size in workers:
+        with ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context('spawn')) as pool:
+            # Don't count starting the workers
+            run_pool(pool, pages[:size], req_fields)
+
+            start = time.perf_counter()
+            run_pool(pool, pages, req_fields)
+            elapsed = time.perf_counter() - start
+
+        print(f'"{size}","{elapsed:.2f}","{granules / elapsed:.0f}","{serial / elapsed:.2f}"')
@@ -1,6 +1,7 @@
 import requests, urllib     # For talking w/ API
 import json, csv            # File stuff
 import re                   # Opening/Reading the file stuff
+import time                 # Waiting before following a cursor
 from io import StringIO     # Opening/Reading the file stuff
 from copy import deepcopy   # For making duplicate dicts
 # from error_msg import error_msg
@@ -34,9 +35,9 @@ class test_URL_Manager():
 
         # Get the url string and (bool)if assert was used:
         keywords, assert_used = self.getKeywords(test_info)
-        if use_cmr_maturity:
-            keywords.append("maturity=" + test_vars["maturity"])
-        self.query = full_url + "&".join(keywords)
+        self.full_url = full_url
+        self.extra_keywords = ["maturity=" + test_vars["maturity"]] if use_cmr_maturity else []
+        self.query = full_url + "&".join(keywords + self.extra_keywords)
         self.error_msg = "Reason: {0}\n - URL: '{1}'".format("{0}",self.query)
 
         # Figure out if you should print stuff:
@@ -61,7 +62,7 @@ class test_URL_Manager():
     def getKeywords(self, test_info):
         # DONT add these to url. (Used for tester). Add ALL others to allow testing keywords that don't exist
         reserved_keywords = ["title", "print", "api", "skip_file_check", "maturity", "use_maturity"]
-        asserts_keywords = ["expected file","expected code"]
+        asserts_keywords = ["expected file","expected code","follow cursor","newest first"]
 
 
         assert_used = 0 != len([k for k,_ in test_info.items() if k in asserts_keywords])
@@ -135,7 +136,9 @@ class test_URL_Manager():
         h = requests.head(self.query)
         content_header = h.headers.get('content-type')
         try:
-            file_content = requests.get(self.query).content.decode("utf-8")
+            r = requests.get(self.query)
+            file_content = r.content.decode("utf-8")
+            self.next_cursor = r.headers.get("ASF-Next-Cursor")
         except requests.exceptions.ChunkedEncodingError:
             assert False, self.error_msg.format("Server returned no info. Normally means it's overloaded.")
         # text/csv; charset=utf-8
@@ -216,6 +219,10 @@ class test_URL_Manager():
     def runAssertTests(self, test_info, status_code, content_type, file_content):
         if "expected code" in test_info:
             assert test_info["expected code"] == status_code, self.error_msg.format("Status codes is different than expected.")
+        if "follow cursor" in test_info and test_info["follow cursor"] == True:
+            self.followCursor(test_info, file_content)
+        if "newest first" in test_info:
+            self.checkNewestFirst(test_info, file_content)
         if "count" in file_content and "maxResults" in test_info:
             assert test_info["maxResults"] >= file_content["count"], self.error_msg.format("API returned too many results.")
         if "expected file" in test_info:
@@ -395,6 +402,41 @@ class test_URL_Manager():
 
 
 
+    def followCursor(self, test_info, file_content):
+        # Only checks csv pages. The next page has to be different results, with the same search:
+        assert self.next_cursor != None, self.error_msg.format("Page was returned without an ASF-Next-Cursor header.")
+        assert file_content["count"] <= int(test_info["pagesize"]), self.error_msg.format("API returned more results than pagesize.")
+        next_query = self.query + "&cursor=" + urllib.parse.quote(self.next_cursor)
+        # Let anything the search resolved against the current time (a missing end) move on first:
+        time.sleep(1.5)
+        r = requests.get(next_query)
+        assert r.status_code == 200, self.error_msg.format("Following the cursor returned code {0}. URL: '{1}'".format(r.status_code, next_query))
+        next_page = [row["Granule Name"] for row in csv.DictReader(StringIO(r.content.decode("utf-8")))]
+        assert 0 < len(next_page) <= int(test_info["pagesize"]), self.error_msg.format("Next page returned {0} results.".format(len(next_page)))
+        overlap = set(next_page) & set(file_content["Granule Name"])
+        assert len(overlap) == 0, self.error_msg.format("Next page repeated results from the first one: {0}".format(overlap))
+
+    def checkNewestFirst(self, test_info, file_content):
+        # Only checks csv. The key names a list param that's split into several CMR queries, each value
+        # is searched on its own, and the top maxResults of all of them together is what should come back:
+        def sortable(end_time):
+            seconds, _, fraction = end_time.rstrip("Z").partition(".")
+            return seconds + "." + fraction.ljust(6, "0")
+
+        param = test_info["newest first"]
+        end_times = []
+        for value in str(test_info[param]).split(","):
+            single = dict(test_info)
+            single[param] = value
+            keywords, _ = self.getKeywords(single)
+            r = requests.get(self.full_url + "&".join(keywords + self.extra_keywords))
+            assert r.status_code == 200, self.error_msg.format("Searching {0}={1} on its own returned code {2}.".format(param, value, r.status_code))
+            end_times += [sortable(row["End Time"]) for row in csv.DictReader(StringIO(r.content.decode("utf-8")))]
+
+        expected = sorted(end_times, reverse=True)[:int(test_info["maxResults"])]
+        returned = [sortable(t) for t in file_content["End Time"]]
+        assert returned == expected, self.error_msg.format("Results aren't the newest across every {0}.\nReturned: {1}\nExpected: {2}".format(param, returned, expected))
+
     def parseTestValues(self, test_info):
         # Turn string values to lists:
         mutatable_dict = deepcopy(test_info)